@@ -0,0 +1,29 @@
+"""Convert the logical model spreadsheet to Parquet for faster mapper start-up
+
+Run from the repository root:
+
+    python scripts/convert_logical_model.py
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.udm_mapper import LOGICAL_MODEL_CSV, LOGICAL_MODEL_DTYPES, LOGICAL_MODEL_PARQUET
+
+
+def main() -> int:
+    if not os.path.exists(LOGICAL_MODEL_CSV):
+        print(f"{LOGICAL_MODEL_CSV} not found")
+        return 1
+
+    logical_model = pd.read_csv(LOGICAL_MODEL_CSV, dtype=LOGICAL_MODEL_DTYPES)
+    logical_model.to_parquet(LOGICAL_MODEL_PARQUET, index=False)
+    print(f"Wrote {len(logical_model)} rows to {LOGICAL_MODEL_PARQUET}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
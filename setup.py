@@ -1,5 +1,19 @@
+import os
+
 from setuptools import setup, find_packages
 
+# Optionally compile the FHIR bundle builders to C with mypyc. mypy is not in
+# [build-system] requires, so install it first and build without isolation:
+#   pip install mypy && AEGIS_MYPYC=1 pip install --no-build-isolation .
+# Running `mypy` checks the same module with the [tool.mypy] settings in pyproject.toml.
+ext_modules = []
+if os.environ.get("AEGIS_MYPYC") == "1":
+    from mypyc.build import mypycify
+
+    ext_modules = mypycify(
+        ["--ignore-missing-imports", "--follow-imports=silent", "src/udm_mapper_enhanced.py"]
+    )
+
 setup(
     name="aegis-health-chain",
     version="0.1.0",
@@ -15,5 +29,6 @@ setup(
         "scikit-learn>=1.2.0",
         "python-dotenv>=1.0.0",
     ],
+    ext_modules=ext_modules,
     python_requires=">=3.9",
 )
@@ -4,7 +4,7 @@ __version__ = "0.1.0"
 __author__ = "Aegis Health Team"
 
 from .udm_mapper import UDMMapper, udm_mapper
-from .huggingface_models import ClinicalForecastingModels, clinical_models
+from .huggingface_models import ClinicalForecastingModels
 from .data_pipeline import DataPipeline, data_pipeline
 from .healthcare_standards import HealthcareStandardsMapper, standards_mapper
 from .udm_mapper_enhanced import EnhancedUDMMapper
@@ -24,3 +24,12 @@ __all__ = [
     "HL7v2ToFHIRConverter",
     "hl7_converter",
 ]
+
+
+def __getattr__(name):
+    # `clinical_models` is created lazily so importing the package stays light
+    if name == "clinical_models":
+        from .huggingface_models import clinical_models
+
+        return clinical_models
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,39 @@
 """Data pipeline for ETL processes"""
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 import logging
-from .udm_mapper import udm_mapper
+from .serialization import dumps, loads
+from .udm_mapper import VECTORIZED_SOURCE_SYSTEMS, frame_records, udm_mapper
+
+# pyarrow parses large CSV/NDJSON files considerably faster than pandas
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.json as pa_json
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Records per task when mapping in worker processes; amortizes pickling cost
+PARALLEL_BATCH_SIZE = 1000
+
+# Low-cardinality string columns stored as pandas categoricals after load
+CATEGORICAL_COLUMNS = ("SEX", "GENDER", "RACE", "ETHNICITY", "SOURCE_SYSTEM", "STATUS")
+
+# Value pools for synthetic patients
+SYNTHETIC_GENDERS = ("male", "female")
+SYNTHETIC_RACES = ("White", "Black", "Asian", "Other")
+SYNTHETIC_ETHNICITIES = ("Hispanic", "Not Hispanic")
+
 
 class DataPipeline:
     """ETL pipeline for healthcare data"""
@@ -14,80 +41,253 @@ class DataPipeline:
     def __init__(self):
         self.udm_mapper = udm_mapper
 
-    def process_ehr_data(self, raw_data_path: str, source_system: str) -> List[Dict[str, Any]]:
-        """Process EHR data from file"""
+    def process_ehr_data(
+        self, raw_data_path: str, source_system: str, n_jobs: Optional[int] = 1
+    ) -> List[Dict[str, Any]]:
+        """Process EHR data from file
+
+        Set `n_jobs` > 1 (or None / a value <= 0 for one per CPU) to map records in worker processes.
+        """
         logger.info(f"Processing EHR data from {raw_data_path}")
-        
-        # Read raw data
+
+        udm_data = list(self.process_ehr_data_iter(raw_data_path, source_system, n_jobs=n_jobs))
+
+        logger.info(f"Processed {len(udm_data)} records")
+        return udm_data
+
+    def process_ehr_data_iter(
+        self, raw_data_path: str, source_system: str, chunksize: int = 10_000, n_jobs: Optional[int] = 1
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream UDM records from an EHR file, reading `chunksize` rows at a time"""
+        chunks = self._read_chunks(raw_data_path, chunksize)
+        if n_jobs is None or n_jobs <= 0:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs == 1:
+            for offset, chunk in chunks:
+                yield from self._map_records(frame_records(chunk), source_system, offset)
+        else:
+            yield from self._map_records_parallel(chunks, source_system, n_jobs)
+
+    def process_ehr_data_vectorized(self, raw_data_path: str, source_system: str) -> List[Dict[str, Any]]:
+        """Process EHR data from file, mapping whole columns at once
+
+        Epic and Cerner extracts are mapped column-wise; other source systems
+        fall back to the per-record mapper.
+        """
+        logger.info(f"Processing EHR data from {raw_data_path} (vectorized)")
+
+        raw_df = self._read_frame(raw_data_path)
+        udm_data = self._map_frame_to_udm(raw_df, source_system)
+
+        logger.info(f"Processed {len(udm_data)} records")
+        return udm_data
+
+    def _map_records(
+        self, records: List[Dict[str, Any]], source_system: str, offset: int = 0
+    ) -> Iterator[Dict[str, Any]]:
+        """Map raw records one at a time, skipping (and logging) failures"""
+        for i, record in enumerate(records, start=offset):
+            try:
+                yield self.udm_mapper.map_ehr_to_udm(record, source_system)
+            except Exception as e:
+                logger.error(f"Error processing row {i}: {e}")
+                continue
+
+    def _map_records_parallel(
+        self, chunks: Iterable[Tuple[int, pd.DataFrame]], source_system: str, n_jobs: int
+    ) -> Iterator[Dict[str, Any]]:
+        """Map record batches in a process pool, yielding results in input order
+
+        Only a few batches per worker are in flight at once, so memory stays
+        bounded when streaming large files.
+        """
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_init_worker, initargs=(self.udm_mapper,)
+        ) as executor:
+            pending = deque()
+            for offset, chunk in chunks:
+                records = frame_records(chunk)
+                for start in range(0, len(records), PARALLEL_BATCH_SIZE):
+                    batch = records[start:start + PARALLEL_BATCH_SIZE]
+                    pending.append(executor.submit(_map_records_in_worker, batch, source_system, offset + start))
+                    if len(pending) >= 2 * n_jobs:
+                        yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def _map_frame_to_udm(self, raw_df: pd.DataFrame, source_system: str) -> List[Dict[str, Any]]:
+        """Map a DataFrame of raw EHR rows to UDM records"""
+        if source_system not in VECTORIZED_SOURCE_SYSTEMS:
+            # Map record by record so a bad row is logged and skipped
+            return list(self._map_records(frame_records(raw_df), source_system))
+        return self.udm_mapper.map_ehr_batch(raw_df, source_system)
+
+    def _read_chunks(self, raw_data_path: str, chunksize: int) -> Iterator[Tuple[int, pd.DataFrame]]:
+        """Yield (row offset, DataFrame) chunks from a CSV, NDJSON or JSON file"""
         if raw_data_path.endswith('.csv'):
-            raw_df = pd.read_csv(raw_data_path)
+            # Read as strings so every chunk sees the same column types
+            reader = pd.read_csv(raw_data_path, chunksize=chunksize, dtype=str)
+        elif raw_data_path.endswith(('.jsonl', '.ndjson')):
+            # Keep values as written; inference would turn "00123" into 123
+            reader = pd.read_json(raw_data_path, lines=True, chunksize=chunksize, dtype=False, convert_dates=False)
         elif raw_data_path.endswith('.json'):
-            raw_df = pd.read_json(raw_data_path)
+            # Plain JSON documents cannot be split, so they are read in one go
+            reader = [pd.read_json(raw_data_path, dtype=False, convert_dates=False)]
         else:
             raise ValueError(f"Unsupported file format: {raw_data_path}")
-        
-        # Convert to UDM format
-        udm_data = []
-        for _, row in raw_df.iterrows():
+
+        offset = 0
+        for chunk in reader:
+            yield offset, chunk
+            offset += len(chunk)
+
+    def _read_frame(self, raw_data_path: str) -> pd.DataFrame:
+        """Read a whole CSV, NDJSON or JSON file into a DataFrame"""
+        if raw_data_path.endswith('.csv'):
+            raw_df = self._read_csv_frame(raw_data_path)
+        elif raw_data_path.endswith(('.jsonl', '.ndjson')):
+            raw_df = self._read_ndjson_frame(raw_data_path)
+        elif raw_data_path.endswith('.json'):
+            raw_df = pd.read_json(raw_data_path, dtype=False, convert_dates=False)
+        else:
+            raise ValueError(f"Unsupported file format: {raw_data_path}")
+        return self._optimize_dtypes(raw_df)
+
+    def _read_csv_frame(self, raw_data_path: str) -> pd.DataFrame:
+        """Read a CSV with every column as strings, preferring the pyarrow parser"""
+        if not HAS_PYARROW:
+            return pd.read_csv(raw_data_path, dtype=str)
+
+        # pyarrow only takes column types by name, so read the header first
+        with open(raw_data_path, newline="", encoding="utf-8-sig") as f:
+            header = _dedupe_columns(next(csv.reader(f), []))
+        # Pass the deduplicated names ourselves; pyarrow would keep repeated ones
+        read_options = pa_csv.ReadOptions(column_names=header, skip_rows=1) if header else None
+        convert_options = pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in header},
+            strings_can_be_null=True,
+        )
+        return pa_csv.read_csv(
+            raw_data_path, read_options=read_options, convert_options=convert_options
+        ).to_pandas()
+
+    def _read_ndjson_frame(self, raw_data_path: str) -> pd.DataFrame:
+        """Read NDJSON with values kept as written, preferring the pyarrow parser
+
+        pyarrow is used when every record has the first record's fields as
+        strings or nulls; anything else falls back to pandas.
+        """
+        if HAS_PYARROW:
+            # Declare the fields as strings so ISO dates are not read as timestamps
+            with open(raw_data_path, "rb") as f:
+                first = next((line for line in f if line.strip()), b"{}")
+            schema = pa.schema([(name, pa.string()) for name in loads(first)])
+            parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="error")
             try:
-                udm_record = self.udm_mapper.map_ehr_to_udm(row.to_dict(), source_system)
-                udm_data.append(udm_record)
-            except Exception as e:
-                logger.error(f"Error processing row {_}: {e}")
-                continue
-        
-        logger.info(f"Processed {len(udm_data)} records")
-        return udm_data
+                return pa_json.read_json(raw_data_path, parse_options=parse_options).to_pandas()
+            except pa.ArrowInvalid:
+                pass
+        return pd.read_json(raw_data_path, lines=True, dtype=False, convert_dates=False)
 
-    def generate_synthetic_data(self, num_patients: int = 100) -> List[Dict[str, Any]]:
+    def _optimize_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Shrink a freshly loaded DataFrame with categoricals and downcast integers"""
+        for col in CATEGORICAL_COLUMNS:
+            # Text loads as object, or as the str dtype on pandas 3
+            if col in df and (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+                df[col] = df[col].astype("category")
+        for col in df.select_dtypes(include="integer").columns:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        return df
+
+    def generate_synthetic_data(self, num_patients: int = 100, seed: Optional[int] = None) -> List[Dict[str, Any]]:
         """Generate synthetic patient data for testing"""
-        import random
-        from datetime import datetime, timedelta
-        
-        synthetic_data = []
-        conditions = ["Asthma", "Hypertension", "Diabetes", "COPD", "Heart Failure"]
-        genders = ["male", "female"]
-        
-        for i in range(num_patients):
-            birth_date = datetime.now() - timedelta(days=random.randint(365*20, 365*80))
-            patient_data = {
-                "PAT_MRN": f"SYNTH{i:06d}",
-                "BIRTH_DATE": birth_date.strftime("%Y-%m-%d"),
-                "SEX": random.choice(genders),
-                "RACE": random.choice(["White", "Black", "Asian", "Other"]),
-                "ETHNICITY": random.choice(["Hispanic", "Not Hispanic"]),
+        rng = np.random.default_rng(seed)
+
+        ages_in_days = rng.integers(365 * 20, 365 * 80, size=num_patients, endpoint=True)
+        birth_dates = np.datetime64("today", "D") - ages_in_days.astype("timedelta64[D]")
+        mrns = np.char.mod("SYNTH%06d", np.arange(num_patients))
+
+        raw_df = pd.DataFrame(
+            {
+                "PAT_MRN": mrns,
+                "BIRTH_DATE": np.datetime_as_string(birth_dates, unit="D"),
+                "SEX": rng.choice(SYNTHETIC_GENDERS, size=num_patients),
+                "RACE": rng.choice(SYNTHETIC_RACES, size=num_patients),
+                "ETHNICITY": rng.choice(SYNTHETIC_ETHNICITIES, size=num_patients),
             }
-            
-            # Add some random conditions
-            patient_conditions = random.sample(conditions, random.randint(0, 3))
-            if patient_conditions:
-                patient_data["CONDITIONS"] = patient_conditions
-            
-            udm_record = self.udm_mapper.map_ehr_to_udm(patient_data, "epic")
-            synthetic_data.append(udm_record)
-        
+        )
+        synthetic_data = self._map_frame_to_udm(raw_df, "epic")
+
         logger.info(f"Generated {len(synthetic_data)} synthetic patient records")
         return synthetic_data
 
-    def save_udm_data(self, udm_data: List[Dict[str, Any]], output_path: str):
-        """Save UDM data to file"""
-        import json
-        
-        with open(output_path, 'w') as f:
-            json.dump(udm_data, f, indent=2)
-        
-        logger.info(f"Saved UDM data to {output_path}")
+    def save_udm_data(self, udm_data: Iterable[Dict[str, Any]], output_path: str, indent: bool = False):
+        """Save UDM data to file
+
+        Records are written one at a time, so `udm_data` may be a generator
+        such as the one returned by `process_ehr_data_iter`. Output is one
+        compact record per line unless `indent` is set.
+        """
+        newline = b"\n  " if indent else b"\n"
+
+        count = 0
+        with open(output_path, 'wb') as f:
+            f.write(b"[")
+            for record in udm_data:
+                encoded = dumps(record, indent)
+                if indent:
+                    encoded = encoded.replace(b"\n", newline)
+                f.write(b"," + newline if count else newline)
+                f.write(encoded)
+                count += 1
+            f.write(b"\n]" if count else b"]")
+
+        logger.info(f"Saved {count} UDM records to {output_path}")
 
     def load_udm_data(self, input_path: str) -> List[Dict[str, Any]]:
         """Load UDM data from file"""
-        import json
-        
-        with open(input_path, 'r') as f:
-            data = json.load(f)
-        
+        with open(input_path, 'rb') as f:
+            raw = f.read()
+        data = loads(raw)
+
         logger.info(f"Loaded {len(data)} UDM records from {input_path}")
         return data
 
 
+# Pipeline used by process-pool workers, set up once per worker by _init_worker
+_worker_pipeline: Optional[DataPipeline] = None
+
+
+def _dedupe_columns(names: List[str]) -> List[str]:
+    """Rename repeated column names to "name.1", "name.2", ... as pandas.read_csv does"""
+    seen = set(names)
+    counts: Dict[str, int] = {}
+    deduped = []
+    for name in names:
+        if name in counts:
+            new_name = name
+            while new_name in seen:
+                counts[name] += 1
+                new_name = f"{name}.{counts[name]}"
+            seen.add(new_name)
+            deduped.append(new_name)
+        else:
+            counts[name] = 0
+            deduped.append(name)
+    return deduped
+
+
+def _init_worker(mapper) -> None:
+    """Process-pool initializer: receive the UDM mapper once per worker"""
+    global _worker_pipeline
+    _worker_pipeline = DataPipeline()
+    _worker_pipeline.udm_mapper = mapper
+
+
+def _map_records_in_worker(records: List[Dict[str, Any]], source_system: str, offset: int) -> List[Dict[str, Any]]:
+    """Process-pool task: map one batch of raw records"""
+    return list(_worker_pipeline._map_records(records, source_system, offset))
+
+
 # Global instance
 data_pipeline = DataPipeline()
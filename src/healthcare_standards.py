@@ -1,25 +1,85 @@
 """Healthcare standards mapping and terminology services"""
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+import functools
 import requests
 import pandas as pd
 from fhir.resources.codeableconcept import CodeableConcept
 from fhir.resources.coding import Coding
 
+# FHIR system URIs for supported terminology systems
+SYSTEM_URIS = {
+    "icd10": "http://hl7.org/fhir/sid/icd-10-cm",
+    "snomed": "http://snomed.info/sct",
+    "loinc": "http://loinc.org",
+    "cpt": "http://www.ama-assn.org/go/cpt",
+    "rxnorm": "http://www.nlm.nih.gov/research/umls/rxnorm",
+}
+
+# Terminology system names by FHIR system URI
+SYSTEM_NAMES = {uri: system for system, uri in SYSTEM_URIS.items()}
+
+# Display text for known codes (simplified)
+DISPLAY_MAP = {
+    "J45": "Asthma",
+    "195967001": "Asthma",
+    "I10": "Hypertension",
+    "38341003": "Hypertension",
+    "85354-9": "Blood pressure panel",
+    "8462-4": "Diastolic blood pressure",
+}
+
+# Columns of the terminology mapping table; `count` ranks competing targets
+TERMINOLOGY_COLUMNS = ["source_system", "code", "target_system", "target_code", "display", "count"]
+
+
+@functools.lru_cache(maxsize=4096)
+def _lookup_display(code: str, system: str) -> str:
+    """Get display text for a code, caching the formatted fallback text"""
+    return DISPLAY_MAP.get(code, f"Unknown {system} code: {code}")
+
 
 class HealthcareStandardsMapper:
     """Map between different healthcare standards and terminologies"""
 
-    def __init__(self):
-        self.terminology_services = {
-            "icd10": self._map_icd10,
-            "snomed": self._map_snomed,
-            "loinc": self._map_loinc,
-            "cpt": self._map_cpt,
-            "rxnorm": self._map_rxnorm,
-        }
+    __slots__ = (
+        "common_mappings",
+        "_flat_map",
+        "_terminology",
+        "_map_code_cached",
+        "_concept_cached",
+    )
 
+    def __init__(self, terminology_table: Optional[pd.DataFrame] = None):
         # Common mappings for quick lookup
         self.common_mappings = self._load_common_mappings()
+        self._flat_map = self._flatten_common_mappings(self.common_mappings)
+
+        # Table-driven terminology lookup, keyed (source_system, code, target_system)
+        if terminology_table is None:
+            terminology_table = self._load_terminology_table()
+        self._terminology = self._index_terminology(terminology_table)
+
+        # Terminology lookups repeat heavily in real HL7/FHIR traffic
+        self._map_code_cached = functools.lru_cache(maxsize=4096)(self._map_code_uncached)
+        self._concept_cached = functools.lru_cache(maxsize=4096)(self._build_codeable_concept)
+
+    def _load_terminology_table(self) -> pd.DataFrame:
+        """Load known terminology mappings (none are bundled yet)"""
+        # In production, load a terminology/translation export (e.g., Apelon, SNOMED CT mapping)
+        return pd.DataFrame(columns=TERMINOLOGY_COLUMNS)
+
+    def _index_terminology(self, table: pd.DataFrame) -> Dict[Tuple[str, str, str], Tuple[str, str]]:
+        """Index a mapping table, keeping the most frequent target for each source code"""
+        if table.empty:
+            return {}
+
+        # Keep whole rows, so target_code and display always come from the same mapping
+        key = ["source_system", "code", "target_system"]
+        best = table.sort_values("count", ascending=False, kind="stable").drop_duplicates(key, keep="first")
+        keys = zip(best["source_system"], best["code"], best["target_system"])
+        # Blank display cells load as NaN, which must not reach JSON output
+        displays = best["display"].astype(object).where(best["display"].notna(), None)
+        return dict(zip(keys, zip(best["target_code"], displays)))
 
     def _load_common_mappings(self) -> Dict[str, Dict]:
         """Load common code mappings for performance"""
@@ -40,75 +100,75 @@ class HealthcareStandardsMapper:
             },
         }
 
+    def _flatten_common_mappings(self, common_mappings: Dict[str, Dict]) -> Dict[Tuple[str, str], Tuple[str, str]]:
+        """Index condition mappings as {(code, target_system): (mapped_code, display)}"""
+        flat_map = {}
+        for code, entry in common_mappings.get("conditions", {}).items():
+            for target_system, mapped_code in entry.items():
+                if target_system != "display":
+                    flat_map[(code, target_system)] = (mapped_code, entry["display"])
+        return flat_map
+
     def map_code(self, code: str, source_system: str, target_system: str) -> Optional[Dict]:
         """Map codes between healthcare terminology systems"""
         if not code:
             return None
 
+        mapped = self._map_code_cached(code, source_system, target_system)
+        # Hand out a copy so callers cannot modify the cached result
+        return dict(mapped) if mapped is not None else None
+
+    def _map_code_uncached(self, code: str, source_system: str, target_system: str) -> Optional[Dict]:
+        """Map a code without consulting the lookup cache"""
         if source_system == target_system:
             return {"code": code, "system": source_system, "display": self._get_display(code, source_system)}
 
         # Check common mappings first
-        if code in self.common_mappings.get("conditions", {}) and target_system in self.common_mappings["conditions"][code]:
-            mapped_code = self.common_mappings["conditions"][code][target_system]
-            return {"code": mapped_code, "system": target_system, "display": self.common_mappings["conditions"][code]["display"]}
+        hit = self._flat_map.get((code, target_system))
+        if hit:
+            return {"code": hit[0], "system": target_system, "display": hit[1]}
 
-        # Fall back to terminology service
-        mapper = self.terminology_services.get(target_system)
-        if mapper:
-            return mapper(code, source_system)
+        # Fall back to the terminology table
+        hit = self._terminology.get((source_system, code, target_system))
+        if hit:
+            display = hit[1] if hit[1] is not None else self._get_display(hit[0], target_system)
+            return {"code": hit[0], "system": target_system, "display": display}
+
+        # Known target systems pass the code through until real mappings are loaded
+        if target_system in SYSTEM_URIS:
+            return {"code": code, "system": target_system, "display": self._get_display(code, target_system)}
 
         return None
 
-    def create_fhir_codeable_concept(self, code: str, system: str, display: str = None) -> CodeableConcept:
+    def create_fhir_codeable_concept(
+        self, code: str, system: str, display: Optional[str] = None
+    ) -> CodeableConcept:
         """Create FHIR CodeableConcept with proper coding"""
+        template = self._concept_cached(code, system, display)
+        # Shallow copies with their own coding list, so callers cannot modify the cached concept
+        return template.copy(update={"coding": [coding.copy() for coding in template.coding]})
+
+    def _build_codeable_concept(self, code: str, system: str, display: Optional[str]) -> CodeableConcept:
+        """Build a validated CodeableConcept without consulting the lookup cache"""
         system_uri = self._get_system_uri(system)
         coding = Coding(system=system_uri, code=code, display=display or self._get_display(code, system))
         return CodeableConcept.construct(coding=[coding], text=display or coding.display)
 
-    def _get_system_uri(self, system: str) -> str:
-        """Get FHIR system URI for terminology system"""
-        system_uris = {
-            "icd10": "http://hl7.org/fhir/sid/icd-10-cm",
-            "snomed": "http://snomed.info/sct",
-            "loinc": "http://loinc.org",
-            "cpt": "http://www.ama-assn.org/go/cpt",
-            "rxnorm": "http://www.nlm.nih.gov/research/umls/rxnorm",
+    def codeable_concept_dict(self, code: str, system: str, display: Optional[str] = None) -> Dict:
+        """Plain-dict equivalent of create_fhir_codeable_concept, for JSON output"""
+        display = display or self._get_display(code, system)
+        return {
+            "coding": [{"system": self._get_system_uri(system), "code": code, "display": display}],
+            "text": display,
         }
-        return system_uris.get(system, system)
-
-    def _map_icd10(self, code: str, source_system: str) -> Dict:
-        """Map to ICD-10-CM (placeholder)"""
-        # In production, call a terminology/translation service (e.g., Apelon, SNOMED CT mapping)
-        return {"code": code, "system": "icd10", "display": self._get_display(code, "icd10")}
-
-    def _map_snomed(self, code: str, source_system: str) -> Dict:
-        """Map to SNOMED CT (placeholder)"""
-        return {"code": code, "system": "snomed", "display": self._get_display(code, "snomed")}
 
-    def _map_loinc(self, code: str, source_system: str) -> Dict:
-        """Map to LOINC (placeholder)"""
-        return {"code": code, "system": "loinc", "display": self._get_display(code, "loinc")}
-
-    def _map_cpt(self, code: str, source_system: str) -> Dict:
-        """Map to CPT (placeholder)"""
-        return {"code": code, "system": "cpt", "display": self._get_display(code, "cpt")}
-
-    def _map_rxnorm(self, code: str, source_system: str) -> Dict:
-        """Map to RxNorm (placeholder)"""
-        return {"code": code, "system": "rxnorm", "display": self._get_display(code, "rxnorm")}
+    def _get_system_uri(self, system: str) -> str:
+        """Get FHIR system URI for terminology system"""
+        return SYSTEM_URIS.get(system, system)
 
     def _get_display(self, code: str, system: str) -> str:
         """Get display text for a code (simplified)"""
-        display_map = {
-            "J45": "Asthma",
-            "195967001": "Asthma",
-            "I10": "Hypertension",
-            "38341003": "Hypertension",
-            "85354-9": "Blood pressure panel",
-            "8462-4": "Diastolic blood pressure",
-        }
-        return display_map.get(code, f"Unknown {system} code: {code}")
+        return _lookup_display(code, system)
 
 
 # Global instance
@@ -1,32 +1,61 @@
 """HL7v2 to FHIR converter with standards support"""
-from typing import Dict, Any, Optional, List, Tuple
-import re
+from typing import Dict, Any, Hashable, Iterator, Optional, List, Tuple, Union
+import functools
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from fhir.resources.bundle import Bundle, BundleEntry
 from fhir.resources.patient import Patient
 from fhir.resources.observation import Observation
 from fhir.resources.condition import Condition
+from fhir.resources.codeableconcept import CodeableConcept
+from fhir.resources.coding import Coding
 from .healthcare_standards import standards_mapper
+from .serialization import dumps, loads
+
+# HL7 administrative sex codes (table 0001) and their FHIR equivalents
+_HL7_GENDER_MAP = {"M": "male", "F": "female", "O": "other", "U": "unknown"}
+
+# Resource models by resourceType, for rebuilding cached bundles
+_RESOURCE_MODELS = {"Patient": Patient, "Observation": Observation, "Condition": Condition}
+
+# Converted bundles remembered when AEGIS_HL7_CACHE=1
+BUNDLE_CACHE_SIZE = 2048
 
 
 class HL7v2Parser:
     """Parse HL7v2 messages"""
 
-    def __init__(self, field_sep: str = "|", component_sep: str = "^", repeat_sep: str = "~"):
+    __slots__ = ("field_sep", "component_sep", "repeat_sep", "strict_dates")
+
+    def __init__(
+        self, field_sep: str = "|", component_sep: str = "^", repeat_sep: str = "~", strict_dates: bool = False
+    ):
         self.field_sep = field_sep
         self.component_sep = component_sep
         self.repeat_sep = repeat_sep
+        # Validate dates against the calendar instead of only checking digits
+        self.strict_dates = strict_dates
 
-    def parse_message(self, message: str) -> Dict[str, Any]:
-        """Parse HL7v2 message into segments"""
-        lines = message.strip().split("\n")
-        segments = {}
+    def iter_segments(self, message: Union[str, bytes]) -> Iterator[List[str]]:
+        """Lazily yield the fields of each segment in an HL7v2 message"""
+        if isinstance(message, bytes):
+            message = message.decode("utf-8")
 
-        for line in lines:
-            parts = line.split(self.field_sep)
-            if not parts:
-                continue
+        field_sep = self.field_sep
+        # splitlines() accepts both the standard \r and \n segment terminators
+        for line in message.strip().splitlines():
+            if line:
+                yield line.split(field_sep)
 
+    def parse_message(self, message: Union[str, bytes]) -> Dict[str, Any]:
+        """Parse HL7v2 message into segments"""
+        segments = {}
+        for parts in self.iter_segments(message):
             segment_id = parts[0]
             if segment_id not in segments:
                 segments[segment_id] = []
@@ -38,22 +67,23 @@ class HL7v2Parser:
     def parse_pid_segment(self, pid_fields: List[str]) -> Dict[str, Any]:
         """Parse PID (Patient Identification) segment"""
         patient_data = {}
+        num_fields = len(pid_fields)
 
-        if len(pid_fields) > 3:
+        if num_fields > 3:
             patient_data["patient_id"] = pid_fields[3]
 
-        if len(pid_fields) > 5:
-            name_parts = pid_fields[5].split(self.component_sep)
-            if name_parts:
-                family = name_parts[0] if len(name_parts) > 0 else ""
-                given = name_parts[1] if len(name_parts) > 1 else ""
-                patient_data["name"] = f"{given} {family}".strip()
+        if num_fields > 5:
+            # Only family and given name are used, so stop splitting after them
+            name_parts = pid_fields[5].split(self.component_sep, 2)
+            family = name_parts[0]
+            given = name_parts[1] if len(name_parts) > 1 else ""
+            patient_data["name"] = f"{given} {family}".strip()
 
-        if len(pid_fields) > 8:
-            gender_map = {"M": "M", "F": "F", "O": "O", "U": "U"}
-            patient_data["gender"] = gender_map.get(pid_fields[8], "U")
+        if num_fields > 8:
+            gender = pid_fields[8]
+            patient_data["gender"] = gender if gender in _HL7_GENDER_MAP else "U"
 
-        if len(pid_fields) > 7:
+        if num_fields > 7:
             patient_data["birth_date"] = self._parse_hl7_date(pid_fields[7])
 
         return patient_data
@@ -61,17 +91,18 @@ class HL7v2Parser:
     def parse_obx_segment(self, obx_fields: List[str]) -> Dict[str, Any]:
         """Parse OBX (Observation) segment"""
         obs_data = {}
+        num_fields = len(obx_fields)
 
-        if len(obx_fields) > 3:
-            obs_data["code"] = obx_fields[3].split(self.component_sep)[0] if obx_fields[3] else ""
+        if num_fields > 3:
+            obs_data["code"] = obx_fields[3].split(self.component_sep, 1)[0]
 
-        if len(obx_fields) > 5:
+        if num_fields > 5:
             obs_data["value"] = obx_fields[5]
 
-        if len(obx_fields) > 6:
+        if num_fields > 6:
             obs_data["unit"] = obx_fields[6]
 
-        if len(obx_fields) > 14:
+        if num_fields > 14:
             obs_data["effective_datetime"] = self._parse_hl7_date(obx_fields[14])
 
         return obs_data
@@ -79,102 +110,270 @@ class HL7v2Parser:
     def parse_dg1_segment(self, dg1_fields: List[str]) -> Dict[str, Any]:
         """Parse DG1 (Diagnosis) segment"""
         diagnosis_data = {}
+        num_fields = len(dg1_fields)
 
-        if len(dg1_fields) > 3:
-            code_info = dg1_fields[3].split(self.component_sep)
-            diagnosis_data["code"] = code_info[0] if code_info else ""
+        if num_fields > 3:
+            code_info = dg1_fields[3].split(self.component_sep, 2)
+            diagnosis_data["code"] = code_info[0]
             diagnosis_data["description"] = code_info[1] if len(code_info) > 1 else ""
 
-        if len(dg1_fields) > 5:
+        if num_fields > 5:
             diagnosis_data["diagnosis_date"] = self._parse_hl7_date(dg1_fields[5])
 
         return diagnosis_data
 
     def _parse_hl7_date(self, hl7_date: str) -> Optional[str]:
-        """Parse HL7 date format (YYYYMMDD or YYYYMMDDHHMM) to ISO format"""
+        """Parse HL7 date format (YYYYMMDD or YYYYMMDDHHMM[SS]) to ISO format"""
         if not hl7_date:
             return None
+        return _format_hl7_date(hl7_date, self.strict_dates)
+
 
+@functools.lru_cache(maxsize=1024)
+def _format_hl7_date(hl7_date: str, strict: bool = False) -> Optional[str]:
+    """Reformat an HL7 timestamp by string slicing
+
+    Fields are range-checked as strings (month 01-12, day 01-31, hour < 24,
+    minute and second < 60). Month lengths and leap years are only checked
+    when `strict` is set, in which case the value must be a real calendar
+    date and time.
+    """
+    date_part = hl7_date[:8]
+    if len(date_part) < 8 or not date_part.isdigit():
+        return None
+    if not ("01" <= date_part[4:6] <= "12" and "01" <= date_part[6:8] <= "31"):
+        return None
+
+    hour = minute = second = "00"
+    if len(hl7_date) >= 12 and hl7_date[8:12].isdigit():
+        hour, minute = hl7_date[8:10], hl7_date[10:12]
+        if len(hl7_date) >= 14 and hl7_date[12:14].isdigit():
+            second = hl7_date[12:14]
+        if hour >= "24" or minute >= "60" or second >= "60":
+            return None
+
+    if strict:
         try:
-            if len(hl7_date) >= 8:
-                year = int(hl7_date[0:4])
-                month = int(hl7_date[4:6])
-                day = int(hl7_date[6:8])
-                dt = datetime(year, month, day)
-                return dt.isoformat()
-        except (ValueError, IndexError):
+            datetime(
+                int(date_part[0:4]), int(date_part[4:6]), int(date_part[6:8]),
+                int(hour), int(minute), int(second),
+            )
+        except ValueError:
             return None
 
-        return None
+    return f"{date_part[0:4]}-{date_part[4:6]}-{date_part[6:8]}T{hour}:{minute}:{second}"
 
 
 class HL7v2ToFHIRConverter:
     """Convert HL7v2 messages to FHIR resources"""
 
-    def __init__(self):
-        self.parser = HL7v2Parser()
-        self.standards_mapper = standards_mapper
+    __slots__ = ("parser", "standards_mapper", "_ids", "_id_run")
 
-    def convert_message(self, hl7_message: str) -> Bundle:
-        """Convert complete HL7v2 message to FHIR Bundle"""
-        segments = self.parser.parse_message(hl7_message)
-        entries = []
+    # Shared by all converters so replayed messages hit regardless of instance.
+    # Entries hold the bundle as JSON bytes, plus a template Bundle for model
+    # callers; every hit decodes a private copy of the nested values
+    _bundle_cache: "OrderedDict[Hashable, Tuple[bytes, Optional[Bundle]]]" = OrderedDict()
+    _bundle_cache_lock = threading.Lock()
+
+    def __init__(self, strict_dates: bool = False):
+        self.parser = HL7v2Parser(strict_dates=strict_dates)
+        self.standards_mapper = standards_mapper
+        # Ids are a per-converter counter tagged with the construction time, so
+        # converters in different processes don't collide
+        self._ids = itertools.count(1)
+        self._id_run = format(time.time_ns(), "x")
+
+    def convert_message(self, hl7_message: str, return_dict: bool = False) -> Union[Bundle, Dict[str, Any]]:
+        """Convert complete HL7v2 message to FHIR Bundle
+
+        With `return_dict`, the Bundle and its resources are returned as plain
+        dicts ready for JSON serialization, skipping model construction.
+
+        Set AEGIS_HL7_CACHE=1 to reuse bundles for repeated messages
+        (retries, duplicate feeds); callers receive a private copy.
+        """
+        if os.environ.get("AEGIS_HL7_CACHE") != "1":
+            return self._segments_to_bundle(self.parser.parse_message(hl7_message), {}, return_dict)
+
+        parser = self.parser
+        raw = hl7_message if isinstance(hl7_message, bytes) else hl7_message.encode("utf-8")
+        # Parser settings change the output, so they are part of the key
+        key = (
+            hashlib.blake2b(raw, digest_size=16).digest(),
+            return_dict,
+            parser.field_sep,
+            parser.component_sep,
+            parser.repeat_sep,
+            parser.strict_dates,
+        )
+        cache = HL7v2ToFHIRConverter._bundle_cache
+        lock = HL7v2ToFHIRConverter._bundle_cache_lock
+
+        with lock:
+            cached = cache.get(key)
+            if cached is not None:
+                cache.move_to_end(key)
+
+        if cached is None:
+            bundle = self._segments_to_bundle(parser.parse_message(hl7_message), {}, return_dict=True)
+            encoded = dumps(bundle)
+            template = None if return_dict else self._bundle_from_dict(loads(encoded))
+            with lock:
+                cache[key] = (encoded, template)
+                if len(cache) > BUNDLE_CACHE_SIZE:
+                    cache.popitem(last=False)
+        else:
+            encoded, template = cached
+            bundle = loads(encoded)
+
+        return bundle if template is None else self._bundle_from_template(template, bundle)
+
+    def convert_messages(
+        self, hl7_messages: List[str], return_dict: bool = False
+    ) -> List[Union[Bundle, Dict[str, Any]]]:
+        """Convert a batch of HL7v2 messages to FHIR Bundles
+
+        Terminology lookups are shared across the batch, so each distinct
+        diagnosis code is mapped only once.
+        """
+        mapped_codes: Dict[Tuple[str, str, str], Optional[Dict]] = {}
+        return [
+            self._segments_to_bundle(self.parser.parse_message(message), mapped_codes, return_dict)
+            for message in hl7_messages
+        ]
+
+    def _segments_to_bundle(
+        self,
+        segments: Dict[str, Any],
+        mapped_codes: Dict[Tuple[str, str, str], Optional[Dict]],
+        return_dict: bool = False,
+    ) -> Union[Bundle, Dict[str, Any]]:
+        """Build a FHIR Bundle from parsed segments, memoizing code lookups in `mapped_codes`"""
+        resources = []
 
         # Process PID for Patient
-        patient = None
+        patient_id = "unknown"
         if "PID" in segments and segments["PID"]:
             patient_data = self.parser.parse_pid_segment(segments["PID"][0])
-            patient = self._create_fhir_patient(patient_data)
-            entries.append(BundleEntry.construct(resource=patient))
-
-        patient_id = patient.id if patient else "unknown"
+            patient = self._create_fhir_patient(patient_data, return_dict)
+            patient_id = patient["id"] if return_dict else patient.id
+            resources.append(patient)
 
         # Process OBX for Observations
         if "OBX" in segments:
             for obx_segment in segments["OBX"]:
                 obs_data = self.parser.parse_obx_segment(obx_segment)
-                obs = self._create_fhir_observation(obs_data, patient_id)
-                entries.append(BundleEntry.construct(resource=obs))
+                resources.append(self._create_fhir_observation(obs_data, patient_id, return_dict))
 
         # Process DG1 for Conditions (Diagnoses)
         if "DG1" in segments:
             for dg1_segment in segments["DG1"]:
                 diagnosis_data = self.parser.parse_dg1_segment(dg1_segment)
-                condition = self._create_fhir_condition(diagnosis_data, patient_id)
-                entries.append(BundleEntry.construct(resource=condition))
+                resources.append(self._create_fhir_condition(diagnosis_data, patient_id, mapped_codes, return_dict))
+
+        if return_dict:
+            return {
+                "resourceType": "Bundle",
+                "type": "transaction",
+                "entry": [{"resource": resource} for resource in resources],
+            }
+
+        return Bundle.construct(
+            resourceType="Bundle",
+            type="transaction",
+            entry=[BundleEntry.construct(resource=resource) for resource in resources],
+        )
+
+    def _bundle_from_dict(self, bundle: Dict[str, Any]) -> Bundle:
+        """Build Bundle models from the plain-dict form of a bundle"""
+        entries = []
+        for entry in bundle["entry"]:
+            resource = entry["resource"]
+            if "code" in resource:
+                # The cached dicts were built by this converter, so skip validation
+                code = resource["code"]
+                resource["code"] = CodeableConcept.construct(
+                    coding=[Coding.construct(**coding) for coding in code["coding"]], text=code["text"]
+                )
+            model = _RESOURCE_MODELS[resource["resourceType"]]
+            entries.append(BundleEntry.construct(resource=model.construct(**resource)))
 
-        bundle_data = {
-            "resourceType": "Bundle",
-            "type": "transaction",
-            "entry": entries,
-        }
+        return Bundle.construct(resourceType="Bundle", type="transaction", entry=entries)
 
-        return Bundle.construct(**bundle_data)
+    def _bundle_from_template(self, template: Bundle, bundle: Dict[str, Any]) -> Bundle:
+        """Copy a cached Bundle, taking nested values from its decoded dict form
 
-    def _create_fhir_patient(self, patient_data: Dict[str, Any]) -> Patient:
+        Shallow model copies cost a fraction of construct(), and codes get
+        their own CodeableConcept and Coding copies, so callers may mutate
+        the result freely. copy() is used rather than model_copy() so the
+        pydantic-v1 models of fhir.resources 6.x/7.x work too.
+        """
+        entries = []
+        for entry, entry_data in zip(template.entry, bundle["entry"]):
+            resource = entry.resource
+            update = {
+                name: value
+                for name, value in entry_data["resource"].items()
+                if isinstance(value, (dict, list)) and name != "code"
+            }
+            if "code" in entry_data["resource"]:
+                code = resource.code
+                update["code"] = code.copy(update={"coding": [coding.copy() for coding in code.coding]})
+            entries.append(entry.copy(update={"resource": resource.copy(update=update)}))
+
+        return template.copy(update={"entry": entries})
+
+    def _next_id(self, prefix: str) -> str:
+        """Generate a unique resource id without reading the clock"""
+        return f"hl7-{prefix}-{self._id_run}-{next(self._ids)}"
+
+    def _map_code(
+        self,
+        code: str,
+        source_system: str,
+        target_system: str,
+        mapped_codes: Dict[Tuple[str, str, str], Optional[Dict]],
+    ) -> Optional[Dict]:
+        """Map a code through the standards mapper, memoized in `mapped_codes`"""
+        key = (code, source_system, target_system)
+        if key not in mapped_codes:
+            mapped_codes[key] = self.standards_mapper.map_code(code, source_system, target_system)
+        return mapped_codes[key]
+
+    def _codeable_concept(self, code: str, system: str, display: Optional[str], return_dict: bool):
+        """CodeableConcept as a model instance, or as a plain dict when `return_dict`"""
+        if return_dict:
+            return self.standards_mapper.codeable_concept_dict(code, system, display)
+        return self.standards_mapper.create_fhir_codeable_concept(code, system, display)
+
+    def _create_fhir_patient(
+        self, patient_data: Dict[str, Any], return_dict: bool = False
+    ) -> Union[Patient, Dict[str, Any]]:
         """Create FHIR Patient from HL7v2 PID data"""
+        patient_id = patient_data["patient_id"] if "patient_id" in patient_data else self._next_id("patient")
         fhir_data = {
             "resourceType": "Patient",
-            "id": patient_data.get("patient_id", f"hl7-patient-{datetime.now().timestamp()}"),
+            "id": patient_id,
         }
 
         if "name" in patient_data:
             fhir_data["name"] = [{"text": patient_data["name"]}]
 
         if "gender" in patient_data:
-            gender_map = {"M": "male", "F": "female", "O": "other", "U": "unknown"}
-            fhir_data["gender"] = gender_map.get(patient_data["gender"], "unknown")
+            fhir_data["gender"] = _HL7_GENDER_MAP.get(patient_data["gender"], "unknown")
 
         if "birth_date" in patient_data:
             fhir_data["birthDate"] = patient_data["birth_date"]
 
-        return Patient.construct(**fhir_data)
+        return fhir_data if return_dict else Patient.construct(**fhir_data)
 
-    def _create_fhir_observation(self, obs_data: Dict[str, Any], patient_id: str) -> Observation:
+    def _create_fhir_observation(
+        self, obs_data: Dict[str, Any], patient_id: str, return_dict: bool = False
+    ) -> Union[Observation, Dict[str, Any]]:
         """Create FHIR Observation from HL7v2 OBX data"""
         fhir_data = {
             "resourceType": "Observation",
-            "id": f"hl7-obs-{datetime.now().timestamp()}",
+            "id": self._next_id("obs"),
             "status": "final",
             "subject": {"reference": f"Patient/{patient_id}"},
         }
@@ -182,7 +381,7 @@ class HL7v2ToFHIRConverter:
         # Map LOINC code
         if "code" in obs_data:
             code = obs_data["code"]
-            fhir_data["code"] = self.standards_mapper.create_fhir_codeable_concept(code, "loinc")
+            fhir_data["code"] = self._codeable_concept(code, "loinc", None, return_dict)
 
         # Value with unit
         if "value" in obs_data:
@@ -200,13 +399,22 @@ class HL7v2ToFHIRConverter:
         if "effective_datetime" in obs_data and obs_data["effective_datetime"]:
             fhir_data["effectiveDateTime"] = obs_data["effective_datetime"]
 
-        return Observation.construct(**fhir_data)
+        return fhir_data if return_dict else Observation.construct(**fhir_data)
 
-    def _create_fhir_condition(self, diagnosis_data: Dict[str, Any], patient_id: str) -> Condition:
+    def _create_fhir_condition(
+        self,
+        diagnosis_data: Dict[str, Any],
+        patient_id: str,
+        mapped_codes: Optional[Dict[Tuple[str, str, str], Optional[Dict]]] = None,
+        return_dict: bool = False,
+    ) -> Union[Condition, Dict[str, Any]]:
         """Create FHIR Condition from HL7v2 DG1 data"""
+        if mapped_codes is None:
+            mapped_codes = {}
+
         fhir_data = {
             "resourceType": "Condition",
-            "id": f"hl7-cond-{datetime.now().timestamp()}",
+            "id": self._next_id("cond"),
             "subject": {"reference": f"Patient/{patient_id}"},
         }
 
@@ -214,20 +422,18 @@ class HL7v2ToFHIRConverter:
         if "code" in diagnosis_data:
             code = diagnosis_data["code"]
             # Assume ICD-10 format; map to SNOMED CT for FHIR preference
-            mapped = self.standards_mapper.map_code(code, "icd10", "snomed")
+            mapped = self._map_code(code, "icd10", "snomed", mapped_codes)
             if mapped:
-                fhir_data["code"] = self.standards_mapper.create_fhir_codeable_concept(
-                    mapped["code"], "snomed", mapped.get("display")
-                )
+                fhir_data["code"] = self._codeable_concept(mapped["code"], "snomed", mapped.get("display"), return_dict)
             else:
-                fhir_data["code"] = self.standards_mapper.create_fhir_codeable_concept(
-                    code, "icd10", diagnosis_data.get("description")
+                fhir_data["code"] = self._codeable_concept(
+                    code, "icd10", diagnosis_data.get("description"), return_dict
                 )
 
         if "diagnosis_date" in diagnosis_data and diagnosis_data["diagnosis_date"]:
             fhir_data["onsetDateTime"] = diagnosis_data["diagnosis_date"]
 
-        return Condition.construct(**fhir_data)
+        return fhir_data if return_dict else Condition.construct(**fhir_data)
 
 
 # Global instance
@@ -1,35 +1,47 @@
 """HuggingFace model integration for clinical forecasting
 
 This module is written to be resilient in environments where heavy
-dependencies (torch, transformers) may not be installed. Imports are
-attempted at module load but failures are handled so the package can be
-imported in CI or lightweight environments. Use `SKIP_HF_MODELS=1` in
-CI to skip heavy model tests.
+dependencies (torch, transformers) may not be installed. They are only
+imported the first time a model is actually needed, so importing the
+package (e.g. for ETL or HL7 conversion) never pays for them. Use
+`SKIP_HF_MODELS=1` in CI to skip heavy model tests, and `AEGIS_INT8=1`
+to quantize models to int8 when running on CPU.
 """
+from types import SimpleNamespace
 from typing import Dict, Any, List, Optional
+import functools
 import logging
 import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Try importing heavy ML libraries; if unavailable, set flags and
-# provide graceful degradation so tests and CI can import this module.
-HAS_TORCH = True
-HAS_TRANSFORMERS = True
-try:
-    import torch
-except Exception:
-    HAS_TORCH = False
-
-try:
-    from transformers import AutoModel, AutoTokenizer, pipeline
-except Exception:
-    HAS_TRANSFORMERS = False
-    # Provide placeholders to allow attribute access without raising at import
-    AutoModel = None  # type: ignore
-    AutoTokenizer = None  # type: ignore
-    pipeline = None  # type: ignore
+
+@functools.lru_cache(maxsize=None)
+def _lazy_import() -> Optional[SimpleNamespace]:
+    """Import torch and transformers on first use.
+
+    Returns a namespace with `torch`, `AutoModel`, `AutoTokenizer` and
+    `pipeline`, or None if the libraries are unavailable.
+    """
+    try:
+        import torch
+        from transformers import AutoModel, AutoTokenizer, pipeline
+    except Exception:
+        return None
+
+    if "OMP_NUM_THREADS" not in os.environ:
+        torch.set_num_threads(os.cpu_count() or 1)
+
+    return SimpleNamespace(torch=torch, AutoModel=AutoModel, AutoTokenizer=AutoTokenizer, pipeline=pipeline)
+
+
+def _require_ml_libs(purpose: str) -> SimpleNamespace:
+    """Return the lazily imported ML libraries or raise RuntimeError"""
+    ml = _lazy_import()
+    if ml is None:
+        raise RuntimeError(f"torch and transformers are required {purpose}")
+    return ml
 
 
 class ClinicalForecastingModels:
@@ -41,12 +53,8 @@ class ClinicalForecastingModels:
     """
 
     def __init__(self, device: str = None):
-        if HAS_TORCH:
-            self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        else:
-            self.device = device or "cpu"
-
-        logger.info(f"Using device: {self.device}")
+        # Resolved on first access, since auto-detection needs torch
+        self._device = device
 
         # Model registry (strings only; loading is dynamic)
         self.available_models = {
@@ -57,13 +65,21 @@ class ClinicalForecastingModels:
 
         self.loaded_models: Dict[str, Any] = {}
 
+    @property
+    def device(self) -> str:
+        """Device models run on; defaults to CUDA when available"""
+        if self._device is None:
+            ml = _lazy_import()
+            self._device = "cuda" if ml is not None and ml.torch.cuda.is_available() else "cpu"
+            logger.info(f"Using device: {self._device}")
+        return self._device
+
     def load_model(self, model_key: str, task: str = None) -> Any:
         """Load a HuggingFace model. Raises RuntimeError if transformers/torch missing."""
         if model_key not in self.available_models:
             raise ValueError(f"Model {model_key} not available. Choices: {list(self.available_models.keys())}")
 
-        if not (HAS_TRANSFORMERS and HAS_TORCH):
-            raise RuntimeError("torch and transformers are required to load models")
+        ml = _require_ml_libs("to load models")
 
         if model_key in self.loaded_models:
             return self.loaded_models[model_key]
@@ -73,14 +89,24 @@ class ClinicalForecastingModels:
 
         try:
             if task:
-                model = pipeline(
+                model = ml.pipeline(
                     task,
                     model=model_name,
                     device=0 if self.device == "cuda" else -1,
                 )
             else:
-                tokenizer = AutoTokenizer.from_pretrained(model_name)
-                model = AutoModel.from_pretrained(model_name).to(self.device)
+                tokenizer = ml.AutoTokenizer.from_pretrained(model_name)
+                model = ml.AutoModel.from_pretrained(model_name).to(self.device)
+                if self.device == "cuda" and os.environ.get("AEGIS_FP16") == "1":
+                    # FP16 halves memory traffic for GPU inference
+                    model = model.half()
+                # Inference only: disable dropout once at load time
+                model.eval()
+                if self.device == "cpu" and os.environ.get("AEGIS_INT8") == "1":
+                    # Dynamic int8 quantization of Linear layers for CPU inference
+                    model = ml.torch.ao.quantization.quantize_dynamic(
+                        model, {ml.torch.nn.Linear}, dtype=ml.torch.qint8
+                    )
                 model = {"model": model, "tokenizer": tokenizer}
 
             self.loaded_models[model_key] = model
@@ -95,8 +121,15 @@ class ClinicalForecastingModels:
 
         Requires `torch` and `transformers`. Raises `RuntimeError` otherwise.
         """
-        if not (HAS_TRANSFORMERS and HAS_TORCH):
-            raise RuntimeError("torch and transformers are required for embedding extraction")
+        return self.get_clinical_embeddings_batch([text], model_key)
+
+    def get_clinical_embeddings_batch(self, texts: List[str], model_key: str = "clinical_bert"):
+        """Get embeddings for a batch of clinical texts in a single forward pass.
+
+        Returns a CPU tensor of shape (len(texts), hidden_size). Padding is
+        excluded from the mean pooling via the attention mask.
+        """
+        ml = _require_ml_libs("for embedding extraction")
 
         model_info = self.load_model(model_key)
 
@@ -104,20 +137,23 @@ class ClinicalForecastingModels:
             tokenizer = model_info["tokenizer"]
             model = model_info["model"]
 
-            inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+            inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
 
-            with torch.no_grad():
+            with ml.torch.inference_mode():
                 outputs = model(**inputs)
-                embeddings = outputs.last_hidden_state.mean(dim=1)
-            return embeddings.cpu()
+                hidden = outputs.last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                embeddings = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            return embeddings.float().cpu()
         else:
             raise ValueError("Embedding extraction requires model+tokenizer format")
 
     def predict_risk(self, patient_data: Dict[str, Any], model_key: str = "clinical_bert") -> Dict[str, Any]:
         """Predict health risk using clinical data. Requires ML libs."""
+        ml = _require_ml_libs("for risk prediction")
         embeddings = self.get_clinical_embeddings(self._patient_data_to_text(patient_data), model_key)
-        risk_score = torch.sigmoid(embeddings.mean()).item()
+        risk_score = ml.torch.sigmoid(embeddings.mean()).item()
         return {
             "risk_score": risk_score,
             "embeddings_shape": embeddings.shape,
@@ -146,8 +182,13 @@ class ClinicalForecastingModels:
         return list(self.available_models.keys())
 
 
-# Global instance
-clinical_models = ClinicalForecastingModels()
+def __getattr__(name: str) -> Any:
+    """Create the global `clinical_models` instance on first access (PEP 562)"""
+    if name == "clinical_models":
+        instance = globals()["clinical_models"] = ClinicalForecastingModels()
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     models = ClinicalForecastingModels()
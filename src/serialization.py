@@ -0,0 +1,28 @@
+"""JSON encoding shared by the mappers, pipeline and HL7 converter"""
+import json
+from typing import Any
+
+# orjson is an optional, much faster JSON backend
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize UDM/FHIR data to JSON bytes, using orjson when it is installed"""
+    if HAS_ORJSON:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=str, option=option)
+    if indent:
+        return json.dumps(obj, indent=2, default=str).encode()
+    return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+def loads(raw: bytes) -> Any:
+    """Parse JSON bytes, using orjson when it is installed"""
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
@@ -1,28 +1,166 @@
 """Unified Data Model mapping engine"""
+import numpy as np
 import pandas as pd
-import json
-from typing import Dict, Any, List
-from datetime import datetime
+import functools
+import os
+from typing import Dict, Any, List, Optional
+from datetime import date, datetime
 import logging
+from .serialization import dumps
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Accepted input date formats, in priority order
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y%m%d"]
+
+# Formats that can match dd/dd/dddd-shaped input
+_SLASH_DATE_FORMATS = ("%m/%d/%Y", "%d/%m/%Y")
+
+_strptime = datetime.strptime
+
+# FHIR administrative-gender by source code, in every casing seen in feeds
+# ("M", "m", "male", "MALE", "Male", ...)
+GENDER_MAP = {
+    key: gender
+    for gender in ("male", "female", "unknown", "other")
+    for key in (gender[0].upper(), gender[0].lower(), gender, gender.upper(), gender.title())
+}
+
+# Generic source keys -> (UDM field, priority); lower priority wins when both are set
+_GENERIC_ALIASES = {
+    "id": ("id", 0),
+    "patient_id": ("id", 1),
+    "birth_date": ("birthDate", 0),
+    "birthdate": ("birthDate", 1),
+    "gender": ("gender", 0),
+    "sex": ("gender", 1),
+}
+
+# Logical model spreadsheet; the Parquet copy is written by scripts/convert_logical_model.py
+LOGICAL_MODEL_CSV = "data/logical_model.csv"
+LOGICAL_MODEL_PARQUET = "data/logical_model.parquet"
+LOGICAL_MODEL_DTYPES = {"Entity": "category", "Attribute": "string"}
+
+# Source systems whose patient fields can be mapped column-wise by map_ehr_batch
+VECTORIZED_SOURCE_SYSTEMS = ("epic", "cerner")
+
+
+def _is_iso_shaped(date_str: str) -> bool:
+    """Check for the dddd-dd-dd layout without invoking a parser"""
+    return (
+        len(date_str) == 10
+        and date_str[4] == "-"
+        and date_str[7] == "-"
+        and date_str[:4].isdigit()
+        and date_str[5:7].isdigit()
+        and date_str[8:].isdigit()
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date_string(date_str: str) -> Optional[str]:
+    """Convert a date string in one of DATE_FORMATS to ISO 8601
+
+    Shape checks pick the candidate formats so the common inputs need at
+    most one parse; anything unusual falls back to trying every format.
+    """
+    if _is_iso_shaped(date_str):
+        # Already ISO 8601, so only a calendar check is left; no other format
+        # can match this shape
+        try:
+            date.fromisoformat(date_str)
+            return date_str
+        except ValueError:
+            formats = ()
+    elif len(date_str) == 8 and date_str.isdigit():
+        # %Y%m%d is the only format for eight digits; rearrange, then validate
+        iso_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
+        try:
+            date.fromisoformat(iso_date)
+            return iso_date
+        except ValueError:
+            formats = ()
+    elif len(date_str) == 10 and date_str[2] == "/":
+        formats = _SLASH_DATE_FORMATS
+    else:
+        formats = DATE_FORMATS
+
+    for fmt in formats:
+        try:
+            return _strptime(date_str, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    logger.warning(f"Could not parse date: {date_str}")
+    return None
+
 
 class UDMMapper:
     """Core UDM mapping engine for healthcare data standardization"""
 
+    # Loaded once per process and shared by every mapper; treat as read-only
+    _LOGICAL_MODEL_CACHE: Optional[pd.DataFrame] = None
+
     def __init__(self):
         self.logical_model = self._load_logical_model()
+        self._entity_index = self._index_entities(self.logical_model)
         self.mapping_rules = self._load_mapping_rules()
+        self._dispatch = {
+            "epic": self._map_epic_to_udm,
+            "cerner": self._map_cerner_to_udm,
+            "generic": self._map_generic_to_udm,
+        }
 
     def _load_logical_model(self) -> pd.DataFrame:
-        """Load our logical model spreadsheet"""
+        """Load our logical model spreadsheet, preferring an up-to-date Parquet copy"""
+        if UDMMapper._LOGICAL_MODEL_CACHE is not None:
+            return UDMMapper._LOGICAL_MODEL_CACHE
+
         try:
-            return pd.read_csv("data/logical_model.csv")
+            logical_model = self._read_logical_model()
         except FileNotFoundError:
             logger.warning("Logical model CSV not found, using empty DataFrame")
-            return pd.DataFrame()
+            logical_model = pd.DataFrame()
+
+        UDMMapper._LOGICAL_MODEL_CACHE = logical_model
+        return logical_model
+
+    def _read_logical_model(self) -> pd.DataFrame:
+        """Read the Parquet copy unless the CSV has been edited since it was written"""
+        parquet_mtime = _mtime(LOGICAL_MODEL_PARQUET)
+        if parquet_mtime is not None:
+            csv_mtime = _mtime(LOGICAL_MODEL_CSV)
+            if csv_mtime is not None and parquet_mtime < csv_mtime:
+                logger.warning(
+                    f"{LOGICAL_MODEL_PARQUET} is older than {LOGICAL_MODEL_CSV}, reading the CSV; "
+                    "rerun scripts/convert_logical_model.py"
+                )
+            else:
+                try:
+                    return pd.read_parquet(LOGICAL_MODEL_PARQUET)
+                except ImportError:
+                    pass
+        return self._read_logical_model_csv()
+
+    def _read_logical_model_csv(self) -> pd.DataFrame:
+        """Read the logical model CSV, using the pyarrow parser when installed"""
+        # Only reached when the Parquet copy is missing, so pyarrow is imported here
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+        except ImportError:
+            return pd.read_csv(LOGICAL_MODEL_CSV, dtype=LOGICAL_MODEL_DTYPES, engine="c")
+
+        convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in LOGICAL_MODEL_DTYPES})
+        logical_model = pa_csv.read_csv(LOGICAL_MODEL_CSV, convert_options=convert_options).to_pandas()
+        return logical_model.astype({k: v for k, v in LOGICAL_MODEL_DTYPES.items() if k in logical_model})
+
+    def _index_entities(self, logical_model: pd.DataFrame) -> Dict[str, List[str]]:
+        """Group logical model attributes by entity, keeping spreadsheet order"""
+        if logical_model.empty:
+            return {}
+        grouped = logical_model.groupby("Entity", observed=True, sort=False)["Attribute"]
+        return {entity: attrs.tolist() for entity, attrs in grouped}
 
     def _load_mapping_rules(self) -> Dict[str, Any]:
         """Load mapping rules for different source systems"""
@@ -72,15 +210,68 @@ class UDMMapper:
 
     def map_ehr_to_udm(self, raw_data: Dict[str, Any], source_system: str) -> Dict[str, Any]:
         """Map raw EHR data to UDM format"""
-        logger.info(f"Mapping data from {source_system} to UDM")
+        logger.debug("Mapping data from %s to UDM", source_system)
 
-        if source_system not in self.mapping_rules:
+        mapper = self._dispatch.get(source_system)
+        if mapper is None:
             logger.warning(f"Unknown source system {source_system}, using generic mapping")
-            source_system = "generic"
-
-        mapper = getattr(self, f"_map_{source_system}_to_udm", self._map_generic_to_udm)
+            mapper = self._map_generic_to_udm
         return mapper(raw_data)
 
+    def map_ehr_batch(self, raw_df: pd.DataFrame, source_system: str) -> List[Dict[str, Any]]:
+        """Map a DataFrame of raw EHR rows to UDM records
+
+        Epic and Cerner extracts are mapped a column at a time; other source
+        systems are mapped record by record.
+        """
+        if source_system not in VECTORIZED_SOURCE_SYSTEMS:
+            return [self.map_ehr_to_udm(record, source_system) for record in frame_records(raw_df)]
+
+        df = raw_df.rename(columns=self.mapping_rules[source_system]["patient"])
+        columns = {
+            "resourceType": ["Patient"] * len(df),
+            "id": self._column(df, "id").tolist(),
+            "birthDate": self.standardize_dates(self._column(df, "birthDate")).tolist(),
+            "gender": self._map_unique(self._column(df, "gender"), self._map_gender_code).tolist(),
+        }
+        if source_system == "epic":
+            # These map to dicts, so every record needs its own rather than one shared per value
+            columns["race"] = [self._map_race_code(value) for value in self._column(df, "race")]
+            columns["ethnicity"] = [self._map_ethnicity_code(value) for value in self._column(df, "ethnicity")]
+
+        # Zipping column lists is much cheaper than DataFrame.to_dict(orient="records")
+        fields = list(columns)
+        return [{"patient": dict(zip(fields, row))} for row in zip(*columns.values())]
+
+    def standardize_dates(self, dates: pd.Series) -> pd.Series:
+        """Column-wise equivalent of _standardize_date
+
+        Each distinct value goes through _standardize_date once, so results
+        match the scalar path exactly (including years outside pandas'
+        datetime64 range, such as the 9999-12-31 placeholder).
+        """
+        codes, uniques = pd.factorize(dates)
+        formatted = [self._standardize_date(value) for value in uniques]
+        # Missing values have code -1, which picks the trailing None
+        lookup = np.array(formatted + [None], dtype=object)
+        return pd.Series(lookup[codes], index=dates.index, dtype=object)
+
+    def _column(self, df: pd.DataFrame, name: str) -> pd.Series:
+        """Return a column as Python objects with missing values as None"""
+        if name not in df:
+            return pd.Series([None] * len(df), index=df.index, dtype=object)
+        column = df[name]
+        return column.astype(object).where(column.notna(), None)
+
+    def _map_unique(self, values: pd.Series, func) -> pd.Series:
+        """Apply a scalar mapping function once per distinct value in a column
+
+        Rows with the same value share one result object, so `func` must
+        return immutable values (such as strings).
+        """
+        lookup = {value: func(value) for value in values.unique()}
+        return values.map(lookup).astype(object)
+
     def _map_epic_to_udm(self, epic_data: Dict[str, Any]) -> Dict[str, Any]:
         """Epic-specific mapping logic"""
         udm_patient = {
@@ -105,15 +296,24 @@ class UDMMapper:
 
     def _map_generic_to_udm(self, generic_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generic mapping logic"""
+        # One pass over the record, keeping the highest-priority non-empty alias
+        found = {}
+        priorities = {}
+        for key, value in generic_data.items():
+            alias = _GENERIC_ALIASES.get(key)
+            if alias is None or not value:
+                continue
+            field, priority = alias
+            if field in priorities and priorities[field] <= priority:
+                continue
+            priorities[field] = priority
+            found[field] = value
+
         udm_patient = {
             "resourceType": "Patient",
-            "id": generic_data.get("id") or generic_data.get("patient_id"),
-            "birthDate": self._standardize_date(
-                generic_data.get("birth_date") or generic_data.get("birthdate")
-            ),
-            "gender": self._map_gender_code(
-                generic_data.get("gender") or generic_data.get("sex")
-            ),
+            "id": found.get("id"),
+            "birthDate": self._standardize_date(found.get("birthDate")),
+            "gender": self._map_gender_code(found.get("gender")),
         }
         return {"patient": udm_patient}
 
@@ -122,33 +322,16 @@ class UDMMapper:
         if not date_str:
             return None
 
-        try:
-            # Handle common date formats
-            for fmt in ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y%m%d"]:
-                try:
-                    dt = datetime.strptime(date_str, fmt)
-                    return dt.strftime("%Y-%m-%d")
-                except ValueError:
-                    continue
-            logger.warning(f"Could not parse date: {date_str}")
-            return None
-        except Exception as e:
-            logger.error(f"Error standardizing date {date_str}: {e}")
+        if not isinstance(date_str, str):
+            logger.error(f"Error standardizing date {date_str}: expected a string")
             return None
+        return _parse_date_string(date_str)
 
     def _map_gender_code(self, gender_code: str) -> str:
         """Map gender codes to FHIR administrative-gender"""
-        gender_map = {
-            "M": "male",
-            "F": "female",
-            "U": "unknown",
-            "O": "other",
-            "male": "male",
-            "female": "female",
-            "unknown": "unknown",
-            "other": "other",
-        }
-        return gender_map.get(str(gender_code).upper(), "unknown")
+        if gender_code is None:
+            return "unknown"
+        return GENDER_MAP.get(gender_code) or GENDER_MAP.get(str(gender_code).upper(), "unknown")
 
     def _map_race_code(self, race_code: str) -> Dict[str, Any]:
         """Map race codes to standardized format"""
@@ -164,10 +347,21 @@ class UDMMapper:
 
     def get_entity_attributes(self, entity_name: str) -> List[str]:
         """Get all attributes for a given entity from logical model"""
-        if self.logical_model.empty:
-            return []
-        entity_attrs = self.logical_model[self.logical_model["Entity"] == entity_name]
-        return entity_attrs["Attribute"].tolist()
+        # Copy so callers cannot modify the shared index
+        return list(self._entity_index.get(entity_name, ()))
+
+
+def _mtime(path: str) -> Optional[float]:
+    """Modification time of a file, or None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def frame_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame rows as dicts, with missing cells (NaN, NaT) as None like _column"""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
 
 
 # Singleton instance for easy access
@@ -184,4 +378,4 @@ if __name__ == "__main__":
     }
     result = udm_mapper.map_ehr_to_udm(test_data, "epic")
     print("Test mapping result:")
-    print(json.dumps(result, indent=2))
+    print(dumps(result, indent=True).decode())
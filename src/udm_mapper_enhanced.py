@@ -1,19 +1,32 @@
 """Enhanced UDM (Universal Data Model) mapper with healthcare standards integration"""
-from typing import Dict, Any, Optional, List
-import json
-from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union, cast
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import time
 from fhir.resources.patient import Patient
 from fhir.resources.bundle import Bundle, BundleEntry
+from fhir.resources.condition import Condition
+from fhir.resources.observation import Observation
 from fhir.resources.resource import Resource
-from .healthcare_standards import standards_mapper
+from .healthcare_standards import SYSTEM_NAMES, standards_mapper
+from .serialization import dumps
+from .udm_mapper import GENDER_MAP
+
+# UDM gender codes by FHIR administrative-gender
+_GENDER_REVERSE = {"male": "M", "female": "F", "other": "O", "unknown": "U"}
+
+# Generated resource ids: a per-process run prefix plus a counter per resource type
+_RUN_PREFIX = format(time.time_ns(), "x")
+_COND_COUNTER = itertools.count(1)
+_OBS_COUNTER = itertools.count(1)
 
 
 class EnhancedUDMMapper:
     """Map between Universal Data Model and FHIR resources with standards support"""
 
-    def __init__(self):
+    def __init__(self) -> None:
         self.standards_mapper = standards_mapper
-        self.supported_resources = [
+        self.supported_resources: List[str] = [
             "Patient",
             "Condition",
             "Observation",
@@ -22,9 +35,15 @@ class EnhancedUDMMapper:
             "Encounter",
         ]
 
-    def udm_to_fhir_patient(self, udm_record: Dict[str, Any]) -> Patient:
-        """Convert UDM patient record to FHIR Patient resource"""
-        patient_data = {
+    def udm_to_fhir_patient(
+        self, udm_record: Dict[str, Any], return_dict: bool = False
+    ) -> Union[Patient, Dict[str, Any]]:
+        """Convert UDM patient record to FHIR Patient resource
+
+        With `return_dict`, the resource is returned as a plain dict, ready to
+        serialize, without building the model.
+        """
+        patient_data: Dict[str, Any] = {
             "resourceType": "Patient",
             "id": udm_record.get("patient_id"),
         }
@@ -35,24 +54,21 @@ class EnhancedUDMMapper:
 
         # Gender
         if "gender" in udm_record:
-            gender_map = {"M": "male", "F": "female", "O": "other"}
-            patient_data["gender"] = gender_map.get(udm_record["gender"], "unknown")
+            patient_data["gender"] = GENDER_MAP.get(udm_record["gender"], "unknown")
 
         # Birth date
         if "birth_date" in udm_record:
             patient_data["birthDate"] = udm_record["birth_date"]
 
         # Contact
-        if "contact" in udm_record:
-            patient_data["telecom"] = [
-                {"system": "phone", "value": udm_record["contact"].get("phone")}
-                if udm_record["contact"].get("phone")
-                else None,
-                {"system": "email", "value": udm_record["contact"].get("email")}
-                if udm_record["contact"].get("email")
-                else None,
-            ]
-            patient_data["telecom"] = [t for t in patient_data["telecom"] if t]
+        contact = udm_record.get("contact") or {}
+        telecom = []
+        if contact.get("phone"):
+            telecom.append({"system": "phone", "value": contact["phone"]})
+        if contact.get("email"):
+            telecom.append({"system": "email", "value": contact["email"]})
+        if telecom:
+            patient_data["telecom"] = telecom
 
         # Address
         if "address" in udm_record:
@@ -66,15 +82,35 @@ class EnhancedUDMMapper:
                 }
             ]
 
-        return Patient.construct(**patient_data)
+        return patient_data if return_dict else Patient.construct(**patient_data)
+
+    def udm_to_fhir_condition(
+        self, udm_condition: Dict[str, Any], patient_id: str, return_dict: bool = False
+    ) -> Union[Resource, Dict[str, Any]]:
+        """Convert UDM condition record to FHIR Condition resource with terminology mapping
+
+        With `return_dict`, the resource is returned as a plain dict.
+        """
+        condition_data = self._udm_to_condition_dict(udm_condition, patient_id, return_dict)
+        return condition_data if return_dict else Condition.construct(**condition_data)
 
-    def udm_to_fhir_condition(self, udm_condition: Dict[str, Any], patient_id: str) -> Resource:
-        """Convert UDM condition record to FHIR Condition resource with terminology mapping"""
-        from fhir.resources.condition import Condition
+    def udm_to_fhir_observation(
+        self, udm_obs: Dict[str, Any], patient_id: str, return_dict: bool = False
+    ) -> Union[Resource, Dict[str, Any]]:
+        """Convert UDM observation to FHIR Observation resource
 
+        With `return_dict`, the resource is returned as a plain dict.
+        """
+        obs_data = self._udm_to_observation_dict(udm_obs, patient_id, return_dict)
+        return obs_data if return_dict else Observation.construct(**obs_data)
+
+    def _udm_to_condition_dict(
+        self, udm_condition: Dict[str, Any], patient_id: str, plain: bool = False
+    ) -> Dict[str, Any]:
+        """Build the field dict for a FHIR Condition; `plain` keeps nested values as dicts"""
         condition_data = {
             "resourceType": "Condition",
-            "id": udm_condition.get("id", f"cond-{datetime.now().timestamp()}"),
+            "id": udm_condition["id"] if "id" in udm_condition else f"cond-{_RUN_PREFIX}-{next(_COND_COUNTER)}",
             "subject": {"reference": f"Patient/{patient_id}"},
         }
 
@@ -86,11 +122,9 @@ class EnhancedUDMMapper:
             # Try to map to SNOMED CT (preferred in FHIR)
             mapped = self.standards_mapper.map_code(code, system, "snomed")
             if mapped:
-                condition_data["code"] = self.standards_mapper.create_fhir_codeable_concept(
-                    mapped["code"], "snomed", mapped.get("display")
-                )
+                condition_data["code"] = self._codeable_concept(mapped["code"], "snomed", mapped.get("display"), plain)
             else:
-                condition_data["code"] = self.standards_mapper.create_fhir_codeable_concept(code, system)
+                condition_data["code"] = self._codeable_concept(code, system, None, plain)
 
         # Onset date
         if "onset_date" in udm_condition:
@@ -100,24 +134,22 @@ class EnhancedUDMMapper:
         if "abatement_date" in udm_condition:
             condition_data["abatementDateTime"] = udm_condition["abatement_date"]
 
-        return Condition.construct(**condition_data)
-
-    def udm_to_fhir_observation(self, udm_obs: Dict[str, Any], patient_id: str) -> Resource:
-        """Convert UDM observation to FHIR Observation resource"""
-        from fhir.resources.observation import Observation
+        return condition_data
 
+    def _udm_to_observation_dict(
+        self, udm_obs: Dict[str, Any], patient_id: str, plain: bool = False
+    ) -> Dict[str, Any]:
+        """Build the field dict for a FHIR Observation; `plain` keeps nested values as dicts"""
         obs_data = {
             "resourceType": "Observation",
-            "id": udm_obs.get("id", f"obs-{datetime.now().timestamp()}"),
+            "id": udm_obs["id"] if "id" in udm_obs else f"obs-{_RUN_PREFIX}-{next(_OBS_COUNTER)}",
             "status": "final",
             "subject": {"reference": f"Patient/{patient_id}"},
         }
 
         # Observation code (LOINC preferred)
         if "code" in udm_obs:
-            obs_data["code"] = self.standards_mapper.create_fhir_codeable_concept(
-                udm_obs["code"], "loinc", udm_obs.get("display")
-            )
+            obs_data["code"] = self._codeable_concept(udm_obs["code"], "loinc", udm_obs.get("display"), plain)
 
         # Value
         if "value" in udm_obs:
@@ -135,25 +167,31 @@ class EnhancedUDMMapper:
         if "effective_datetime" in udm_obs:
             obs_data["effectiveDateTime"] = udm_obs["effective_datetime"]
 
-        return Observation.construct(**obs_data)
+        return obs_data
+
+    def _codeable_concept(self, code: str, system: str, display: Optional[str], plain: bool) -> Any:
+        """CodeableConcept as a model instance, or as a plain dict when `plain`"""
+        if plain:
+            return self.standards_mapper.codeable_concept_dict(code, system, display)
+        return self.standards_mapper.create_fhir_codeable_concept(code, system, display)
 
     def fhir_to_udm(self, fhir_resource: Resource) -> Dict[str, Any]:
         """Convert FHIR resource to UDM format"""
         resource_type = fhir_resource.get_resource_type()
 
         if resource_type == "Patient":
-            return self._fhir_patient_to_udm(fhir_resource)
+            return self._fhir_patient_to_udm(cast(Patient, fhir_resource))
         elif resource_type == "Condition":
-            return self._fhir_condition_to_udm(fhir_resource)
+            return self._fhir_condition_to_udm(cast(Condition, fhir_resource))
         elif resource_type == "Observation":
-            return self._fhir_observation_to_udm(fhir_resource)
+            return self._fhir_observation_to_udm(cast(Observation, fhir_resource))
 
         # Generic fallback
         return {"resource_type": resource_type, "data": fhir_resource.dict()}
 
     def _fhir_patient_to_udm(self, patient: Patient) -> Dict[str, Any]:
         """Convert FHIR Patient to UDM"""
-        udm = {
+        udm: Dict[str, Any] = {
             "type": "patient",
             "patient_id": patient.id,
         }
@@ -164,20 +202,21 @@ class EnhancedUDMMapper:
             )
 
         if patient.gender:
-            gender_reverse = {"male": "M", "female": "F", "other": "O", "unknown": "U"}
-            udm["gender"] = gender_reverse.get(patient.gender, "U")
+            udm["gender"] = _GENDER_REVERSE.get(patient.gender, "U")
 
         if patient.birthDate:
             udm["birth_date"] = str(patient.birthDate)
 
         return udm
 
-    def _fhir_condition_to_udm(self, condition) -> Dict[str, Any]:
+    def _fhir_condition_to_udm(self, condition: Condition) -> Dict[str, Any]:
         """Convert FHIR Condition to UDM"""
-        udm = {
+        udm: Dict[str, Any] = {
             "type": "condition",
             "id": condition.id,
-            "patient_id": condition.subject.reference.split("/")[-1] if condition.subject else None,
+            "patient_id": condition.subject.reference.split("/")[-1]
+            if condition.subject and condition.subject.reference
+            else None,
         }
 
         if condition.code and condition.code.coding:
@@ -191,12 +230,14 @@ class EnhancedUDMMapper:
 
         return udm
 
-    def _fhir_observation_to_udm(self, observation) -> Dict[str, Any]:
+    def _fhir_observation_to_udm(self, observation: Observation) -> Dict[str, Any]:
         """Convert FHIR Observation to UDM"""
-        udm = {
+        udm: Dict[str, Any] = {
             "type": "observation",
             "id": observation.id,
-            "patient_id": observation.subject.reference.split("/")[-1] if observation.subject else None,
+            "patient_id": observation.subject.reference.split("/")[-1]
+            if observation.subject and observation.subject.reference
+            else None,
         }
 
         if observation.code and observation.code.coding:
@@ -204,46 +245,70 @@ class EnhancedUDMMapper:
             udm["code"] = coding.code
             udm["display"] = coding.display
 
-        if hasattr(observation, "valueQuantity") and observation.valueQuantity:
-            udm["value"] = observation.valueQuantity.value
-            udm["unit"] = observation.valueQuantity.unit
+        value_quantity = getattr(observation, "valueQuantity", None)
+        if value_quantity is not None:
+            udm["value"] = value_quantity.value
+            udm["unit"] = value_quantity.unit
 
         return udm
 
-    def _parse_system_from_uri(self, uri: str) -> str:
+    def _parse_system_from_uri(self, uri: Optional[str]) -> Optional[str]:
         """Parse system name from FHIR system URI"""
-        system_map = {
-            "http://hl7.org/fhir/sid/icd-10-cm": "icd10",
-            "http://snomed.info/sct": "snomed",
-            "http://loinc.org": "loinc",
-            "http://www.ama-assn.org/go/cpt": "cpt",
-            "http://www.nlm.nih.gov/research/umls/rxnorm": "rxnorm",
-        }
-        return system_map.get(uri, uri)
-
-    def create_fhir_bundle(self, udm_records: List[Dict[str, Any]], patient_id: str) -> Bundle:
-        """Create a FHIR Bundle from multiple UDM records"""
-        entries = []
-
-        for record in udm_records:
-            record_type = record.get("type", "").lower()
-
-            if record_type == "condition":
-                resource = self.udm_to_fhir_condition(record, patient_id)
-            elif record_type == "observation":
-                resource = self.udm_to_fhir_observation(record, patient_id)
-            else:
-                continue
-
-            entries.append(BundleEntry.construct(resource=resource))
-
-        bundle_data = {
-            "resourceType": "Bundle",
-            "type": "transaction",
-            "entry": entries,
-        }
-
-        return Bundle.construct(**bundle_data)
+        if uri is None:
+            return None
+        return SYSTEM_NAMES.get(uri, uri)
+
+    def create_fhir_bundle(
+        self,
+        udm_records: List[Dict[str, Any]],
+        patient_id: str,
+        return_dict: bool = False,
+        max_workers: Optional[int] = None,
+    ) -> Union[Bundle, Dict[str, Any]]:
+        """Create a FHIR Bundle from multiple UDM records
+
+        With `return_dict`, the Bundle and its resources are plain dicts and
+        no models are built. Set `max_workers` to convert records on a thread
+        pool, which pays off when terminology lookups go to a remote service.
+        """
+        if max_workers and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                converted = list(
+                    executor.map(lambda record: self._record_to_entry(record, patient_id, return_dict), udm_records)
+                )
+        else:
+            converted = [self._record_to_entry(record, patient_id, return_dict) for record in udm_records]
+        entries = [entry for entry in converted if entry is not None]
+
+        if return_dict:
+            return {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+        return Bundle.construct(resourceType="Bundle", type="transaction", entry=entries)
+
+    def udm_records_to_fhir_json(self, udm_records: List[Dict[str, Any]], patient_id: str) -> bytes:
+        """Serialize UDM records straight to a FHIR Bundle JSON document
+
+        Builds the plain-dict bundle and encodes it, so no FHIR models are created.
+        """
+        return dumps(self.create_fhir_bundle(udm_records, patient_id, return_dict=True))
+
+    def _record_to_entry(self, record: Dict[str, Any], patient_id: str, return_dict: bool) -> Any:
+        """Build the Bundle entry for one UDM record, or None for unsupported record types"""
+        builder = _ENTRY_BUILDERS.get(record.get("type", "").lower())
+        if builder is None:
+            return None
+
+        to_dict, resource_cls = builder
+        resource_data = to_dict(self, record, patient_id, return_dict)
+        if return_dict:
+            return {"resource": resource_data}
+        return BundleEntry.construct(resource=resource_cls.construct(**resource_data))
+
+
+# Resource builders by UDM record type, used when assembling bundles
+_ENTRY_BUILDERS: Dict[str, Tuple[Callable[..., Dict[str, Any]], Type[Resource]]] = {
+    "condition": (EnhancedUDMMapper._udm_to_condition_dict, Condition),
+    "observation": (EnhancedUDMMapper._udm_to_observation_dict, Observation),
+}
 
 
 # Global instance
@@ -0,0 +1,178 @@
+"""Unit tests for the ETL data pipeline"""
+import json
+
+import pandas as pd
+
+from src.data_pipeline import DataPipeline
+
+
+def write_epic_csv(path):
+    pd.DataFrame(
+        {
+            "PAT_MRN": ["A1", "A2", "A3"],
+            "BIRTH_DATE": ["1990-01-15", "01/02/1980", "19751231"],
+            "SEX": ["M", "F", "U"],
+            "RACE": ["White", "Asian", "Other"],
+            "ETHNICITY": ["Hispanic", "Not Hispanic", "Not Hispanic"],
+        }
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+def test_process_ehr_data_csv(tmp_path):
+    pipeline = DataPipeline()
+    records = pipeline.process_ehr_data(write_epic_csv(tmp_path / "ehr.csv"), "epic")
+
+    assert len(records) == 3
+    assert records[0]["patient"]["id"] == "A1"
+    assert records[1]["patient"]["birthDate"] == "1980-01-02"
+    assert records[2]["patient"]["gender"] == "unknown"
+
+
+def write_epic_ndjson(path):
+    rows = [
+        {"PAT_MRN": "00123", "BIRTH_DATE": "19751231", "SEX": "F", "RACE": "Asian", "ETHNICITY": "Hispanic"},
+        {"PAT_MRN": "00456", "BIRTH_DATE": "1970-07-04", "SEX": "M", "RACE": "White", "ETHNICITY": "Not Hispanic"},
+    ]
+    with open(path, "w") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+    return str(path)
+
+
+def test_process_ehr_data_ndjson(tmp_path):
+    pipeline = DataPipeline()
+    records = pipeline.process_ehr_data(write_epic_ndjson(tmp_path / "ehr.ndjson"), "epic")
+
+    assert [r["patient"]["id"] for r in records] == ["00123", "00456"]
+    assert [r["patient"]["birthDate"] for r in records] == ["1975-12-31", "1970-07-04"]
+
+
+def test_process_ehr_data_json(tmp_path):
+    pipeline = DataPipeline()
+    path = tmp_path / "ehr.json"
+    with open(write_epic_ndjson(tmp_path / "ehr.ndjson")) as f:
+        path.write_text(json.dumps([json.loads(line) for line in f]))
+
+    records = pipeline.process_ehr_data(str(path), "epic")
+    assert [r["patient"]["id"] for r in records] == ["00123", "00456"]
+    assert [r["patient"]["birthDate"] for r in records] == ["1975-12-31", "1970-07-04"]
+    assert pipeline.process_ehr_data_vectorized(str(path), "epic") == records
+
+
+def test_read_frame_stores_categoricals(tmp_path):
+    pipeline = DataPipeline()
+    raw_df = pipeline._read_frame(write_epic_csv(tmp_path / "ehr.csv"))
+
+    assert isinstance(raw_df["SEX"].dtype, pd.CategoricalDtype)
+    assert isinstance(raw_df["RACE"].dtype, pd.CategoricalDtype)
+    assert not isinstance(raw_df["PAT_MRN"].dtype, pd.CategoricalDtype)
+
+
+def test_vectorized_ndjson_matches_per_record(tmp_path):
+    pipeline = DataPipeline()
+    path = write_epic_ndjson(tmp_path / "ehr.ndjson")
+    assert pipeline.process_ehr_data_vectorized(path, "epic") == pipeline.process_ehr_data(path, "epic")
+
+    # Records whose fields differ from the first one still read correctly
+    with open(path, "a") as f:
+        f.write(json.dumps({"PAT_MRN": 789, "BIRTH_DATE": "1980-02-01", "EXTRA": "x"}) + "\n")
+    records = pipeline.process_ehr_data_vectorized(path, "epic")
+    assert records == pipeline.process_ehr_data(path, "epic")
+    assert records[1]["patient"]["birthDate"] == "1970-07-04"
+    assert records[2]["patient"]["birthDate"] == "1980-02-01"
+
+
+def test_chunked_iteration_matches_full_read(tmp_path):
+    pipeline = DataPipeline()
+    path = write_epic_csv(tmp_path / "ehr.csv")
+
+    streamed = list(pipeline.process_ehr_data_iter(path, "epic", chunksize=1))
+    assert streamed == pipeline.process_ehr_data(path, "epic")
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    pipeline = DataPipeline()
+    records = pipeline.process_ehr_data(write_epic_csv(tmp_path / "ehr.csv"), "epic")
+    output = str(tmp_path / "udm.json")
+
+    pipeline.save_udm_data(iter(records), output)
+    assert pipeline.load_udm_data(output) == records
+    with open(output) as f:
+        assert len(f.read().splitlines()) == len(records) + 2
+
+    pipeline.save_udm_data(records, output, indent=True)
+    assert pipeline.load_udm_data(output) == records
+    with open(output) as f:
+        assert f.read() == json.dumps(records, indent=2)
+
+
+def test_vectorized_matches_per_record(tmp_path):
+    pipeline = DataPipeline()
+    path = write_epic_csv(tmp_path / "ehr.csv")
+
+    assert pipeline.process_ehr_data_vectorized(path, "epic") == pipeline.process_ehr_data(path, "epic")
+
+    # Blank cells map to None on both paths
+    blank = tmp_path / "blank.csv"
+    pd.DataFrame(
+        {"PAT_MRN": ["B1", ""], "BIRTH_DATE": ["", "1990-01-15"], "SEX": ["M", ""], "RACE": ["", "Asian"]}
+    ).to_csv(blank, index=False)
+    records = pipeline.process_ehr_data(str(blank), "epic")
+    assert pipeline.process_ehr_data_vectorized(str(blank), "epic") == records
+    assert records[0]["patient"]["race"] is None
+    assert records[0]["patient"]["ethnicity"] is None
+    assert records[1]["patient"]["id"] is None
+
+    # Absent columns map to None, as with dict.get on a single record
+    df = pd.DataFrame({"PAT_MRN": ["A1"], "SEX": ["M"]})
+    batch = pipeline.udm_mapper.map_ehr_batch(df, "epic")
+    assert batch == [pipeline.udm_mapper.map_ehr_to_udm({"PAT_MRN": "A1", "SEX": "M"}, "epic")]
+    assert batch[0]["patient"]["race"] is None
+    assert pipeline.udm_mapper.map_ehr_batch(pd.DataFrame({"SEX": ["M"]}), "epic")[0]["patient"]["id"] is None
+
+
+def test_vectorized_duplicate_csv_header(tmp_path):
+    pipeline = DataPipeline()
+    path = tmp_path / "ehr.csv"
+    path.write_text("PAT_MRN,SEX,SEX,SEX.1\nA1,M,F,U\n")
+
+    assert pipeline._read_frame(str(path)).columns.tolist() == ["PAT_MRN", "SEX", "SEX.2", "SEX.1"]
+    records = pipeline.process_ehr_data_vectorized(str(path), "epic")
+    assert records == pipeline.process_ehr_data(str(path), "epic")
+    assert records[0]["patient"]["gender"] == "male"
+
+
+def test_vectorized_cerner_and_missing_values(tmp_path):
+    pipeline = DataPipeline()
+    path = tmp_path / "cerner.csv"
+    pd.DataFrame(
+        {"PATIENT_ID": ["C1", "C2"], "DOB": ["1970-07-04", ""], "GENDER": ["F", ""]}
+    ).to_csv(path, index=False)
+
+    records = pipeline.process_ehr_data_vectorized(str(path), "cerner")
+    assert records == [
+        {"patient": {"resourceType": "Patient", "id": "C1", "birthDate": "1970-07-04", "gender": "female"}},
+        {"patient": {"resourceType": "Patient", "id": "C2", "birthDate": None, "gender": "unknown"}},
+    ]
+
+
+def test_generate_synthetic_data():
+    pipeline = DataPipeline()
+    records = pipeline.generate_synthetic_data(50, seed=42)
+
+    assert len(records) == 50
+    assert records[0]["patient"]["id"] == "SYNTH000000"
+    assert records[-1]["patient"]["id"] == "SYNTH000049"
+    assert all(r["patient"]["birthDate"] for r in records)
+    assert records == pipeline.generate_synthetic_data(50, seed=42)
+    races = [r["patient"]["race"] for r in records]
+    assert len({id(race) for race in races}) == len(races)
+    assert pipeline.generate_synthetic_data(0) == []
+
+
+def test_parallel_matches_serial(tmp_path):
+    pipeline = DataPipeline()
+    path = write_epic_csv(tmp_path / "ehr.csv")
+
+    assert pipeline.process_ehr_data(path, "epic", n_jobs=2) == pipeline.process_ehr_data(path, "epic")
+    assert pipeline.process_ehr_data(path, "epic", n_jobs=-1) == pipeline.process_ehr_data(path, "epic")
@@ -1,4 +1,7 @@
 """Unit tests for healthcare standards mapper"""
+import json
+
+import pandas as pd
 import pytest
 from src.healthcare_standards import HealthcareStandardsMapper, standards_mapper
 
@@ -48,6 +51,73 @@ class TestHealthcareStandardsMapper:
         assert len(concept.coding) > 0
         assert concept.coding[0].code == "J45"
 
+    def test_map_code_cache_returns_copies(self):
+        """Test that cached lookups cannot be modified by callers"""
+        first = self.mapper.map_code("I10", "icd10", "snomed")
+        first["code"] = "changed"
+
+        second = self.mapper.map_code("I10", "icd10", "snomed")
+        assert second["code"] == "38341003"
+
+    def test_codeable_concept_copies(self):
+        """Test that identical CodeableConcepts are independent copies"""
+        concept = self.mapper.create_fhir_codeable_concept("8480-6", "loinc")
+        again = self.mapper.create_fhir_codeable_concept("8480-6", "loinc")
+        assert again is not concept
+        assert again.coding is not concept.coding
+        assert again.coding[0] is not concept.coding[0]
+
+        concept.text = "changed"
+        concept.coding[0].code = "changed"
+        concept.coding.append(concept.coding[0])
+        fresh = self.mapper.create_fhir_codeable_concept("8480-6", "loinc")
+        assert fresh.text == again.text
+        assert len(fresh.coding) == 1
+        assert fresh.coding[0].code == "8480-6"
+        assert self.mapper.create_fhir_codeable_concept("8480-6", "loinc", "Systolic").text == "Systolic"
+
+    def test_terminology_table_keeps_most_frequent_target(self):
+        """Test that table lookups prefer the most frequent mapping"""
+        table = pd.DataFrame(
+            [
+                ("icd10", "E11", "snomed", "73211009", "Diabetes mellitus", 5),
+                ("icd10", "E11", "snomed", "44054006", "Type 2 diabetes mellitus", 40),
+            ],
+            columns=["source_system", "code", "target_system", "target_code", "display", "count"],
+        )
+        mapper = HealthcareStandardsMapper(terminology_table=table)
+
+        result = mapper.map_code("E11", "icd10", "snomed")
+        assert result == {"code": "44054006", "system": "snomed", "display": "Type 2 diabetes mellitus"}
+        assert mapper.map_code("E11", "icd10", "unknown-system") is None
+
+    def test_terminology_table_keeps_display_with_its_row(self):
+        """Test that the chosen mapping is never mixed with another row's columns"""
+        table = pd.DataFrame(
+            [
+                ("icd10", "E11", "snomed", "73211009", "Diabetes mellitus", 5),
+                ("icd10", "E11", "snomed", "44054006", None, 40),
+            ],
+            columns=["source_system", "code", "target_system", "target_code", "display", "count"],
+        )
+        mapper = HealthcareStandardsMapper(terminology_table=table)
+
+        assert mapper._terminology == {("icd10", "E11", "snomed"): ("44054006", None)}
+
+    def test_terminology_table_blank_display(self, tmp_path):
+        """Test that a blank display cell never surfaces as NaN"""
+        path = tmp_path / "terminology.csv"
+        path.write_text(
+            "source_system,code,target_system,target_code,display,count\n"
+            "icd10,E11,snomed,44054006,,40\n"
+        )
+        mapper = HealthcareStandardsMapper(terminology_table=pd.read_csv(path, dtype={"target_code": str}))
+
+        result = mapper.map_code("E11", "icd10", "snomed")
+        assert result == {"code": "44054006", "system": "snomed", "display": "Unknown snomed code: 44054006"}
+        concept = mapper.codeable_concept_dict(result["code"], "snomed", result["display"])
+        assert "NaN" not in json.dumps(concept)
+
     def test_get_system_uri(self):
         """Test getting FHIR system URIs"""
         uri = self.mapper._get_system_uri("icd10")
@@ -1,5 +1,7 @@
 """Unit tests for HL7v2 -> FHIR converter"""
-from src.hl7v2_converter import HL7v2ToFHIRConverter
+import json
+
+from src.hl7v2_converter import HL7v2Parser, HL7v2ToFHIRConverter
 
 
 def sample_hl7_message():
@@ -63,3 +65,124 @@ def test_condition_conversion():
     assert hasattr(cond, "code") and cond.code is not None
     if cond.code.coding:
         assert cond.code.coding[0].code is not None
+
+
+def test_carriage_return_segment_separators():
+    conv = HL7v2ToFHIRConverter()
+    segments = conv.parser.parse_message(sample_hl7_message().replace("\n", "\r"))
+
+    assert set(segments) == {"MSH", "PID", "OBR", "OBX", "DG1"}
+    assert conv.parser.parse_dg1_segment(segments["DG1"][0])["description"] == "Hypertension"
+
+
+def test_convert_messages_batch():
+    conv = HL7v2ToFHIRConverter()
+    bundles = conv.convert_messages([sample_hl7_message(), sample_hl7_message()])
+
+    assert len(bundles) == 2
+    ids = [e.resource.id for bundle in bundles for e in bundle.entry if e.resource.get_resource_type() != "Patient"]
+    assert len(ids) == len(set(ids))
+
+
+def test_parse_hl7_date_formats():
+    parser = HL7v2Parser()
+    assert parser._parse_hl7_date("19800101") == "1980-01-01T00:00:00"
+    assert parser._parse_hl7_date("202311231200") == "2023-11-23T12:00:00"
+    assert parser._parse_hl7_date("20231123120530") == "2023-11-23T12:05:30"
+    assert parser._parse_hl7_date("2023") is None
+    assert parser._parse_hl7_date("2023AB01") is None
+    assert parser._parse_hl7_date("") is None
+
+    # Out-of-range fields are always rejected
+    assert parser._parse_hl7_date("20231340") is None
+    assert parser._parse_hl7_date("20230001") is None
+    assert parser._parse_hl7_date("20231100") is None
+    assert parser._parse_hl7_date("202311232400") is None
+    assert parser._parse_hl7_date("202311231260") is None
+    assert parser._parse_hl7_date("20231123120560") is None
+    assert parser._parse_hl7_date("20231231235959") == "2023-12-31T23:59:59"
+
+    # Month lengths and leap years are only checked in strict mode
+    assert parser._parse_hl7_date("20230231") == "2023-02-31T00:00:00"
+    assert HL7v2Parser(strict_dates=True)._parse_hl7_date("20230231") is None
+    assert HL7v2Parser(strict_dates=True)._parse_hl7_date("20240229") == "2024-02-29T00:00:00"
+    assert HL7v2Parser(strict_dates=True)._parse_hl7_date("20231101") == "2023-11-01T00:00:00"
+
+
+def test_convert_message_strict_dates():
+    message = sample_hl7_message().replace("||20231101", "||20230231")
+
+    lenient = HL7v2ToFHIRConverter().convert_message(message, return_dict=True)
+    strict = HL7v2ToFHIRConverter(strict_dates=True).convert_message(message, return_dict=True)
+
+    def condition(bundle):
+        return next(e["resource"] for e in bundle["entry"] if e["resource"]["resourceType"] == "Condition")
+
+    assert condition(lenient)["onsetDateTime"] == "2023-02-31T00:00:00"
+    assert "onsetDateTime" not in condition(strict)
+
+
+def test_convert_message_return_dict():
+    conv = HL7v2ToFHIRConverter()
+    bundle = conv.convert_message(sample_hl7_message(), return_dict=True)
+
+    assert bundle["resourceType"] == "Bundle"
+    resources = {e["resource"]["resourceType"]: e["resource"] for e in bundle["entry"]}
+    assert resources["Patient"]["gender"] == "male"
+    assert resources["Observation"]["code"]["coding"][0]["code"] == "8480-6"
+    assert resources["Condition"]["subject"]["reference"] == f"Patient/{resources['Patient']['id']}"
+    # Plain dicts serialize directly
+    assert json.loads(json.dumps(bundle)) == bundle
+
+
+def test_iter_segments_lazy_and_bytes():
+    parser = HL7v2Parser()
+    message = sample_hl7_message()
+
+    segments = parser.iter_segments(message)
+    assert next(segments)[0] == "MSH"
+    assert [parts[0] for parts in segments] == ["PID", "OBR", "OBX", "DG1"]
+
+    # Byte input and CRLF terminators parse the same as text
+    raw = message.replace("\n", "\r\n").encode("utf-8")
+    assert parser.parse_message(raw) == parser.parse_message(message)
+
+    # Segments without a field separator are kept, not dropped
+    assert parser.parse_message(message + "\nNTE")["NTE"] == [["NTE"]]
+
+
+def test_convert_message_cache(monkeypatch):
+    monkeypatch.setenv("AEGIS_HL7_CACHE", "1")
+    monkeypatch.setattr(HL7v2ToFHIRConverter, "_bundle_cache", type(HL7v2ToFHIRConverter._bundle_cache)())
+    conv = HL7v2ToFHIRConverter()
+
+    first = conv.convert_message(sample_hl7_message(), return_dict=True)
+    first["entry"].clear()
+    second = conv.convert_message(sample_hl7_message(), return_dict=True)
+
+    assert len(HL7v2ToFHIRConverter._bundle_cache) == 1
+    assert len(second["entry"]) == 3
+
+    # Model callers get their own entry, and each hit is a private copy
+    bundle = conv.convert_message(sample_hl7_message())
+    assert len(HL7v2ToFHIRConverter._bundle_cache) == 2
+    condition = bundle.entry[2].resource
+    assert condition.code.coding[0].code == second["entry"][2]["resource"]["code"]["coding"][0]["code"]
+    assert condition.code.text == second["entry"][2]["resource"]["code"]["text"]
+    ids = [e.resource.id for e in bundle.entry]
+    condition.code.coding[0].code = "changed"
+    condition.subject["reference"] = "Patient/other"
+    bundle.entry.clear()
+
+    again = conv.convert_message(sample_hl7_message())
+    assert [e.resource.id for e in again.entry] == ids
+    assert again.entry[2].resource.code.coding[0].code == second["entry"][2]["resource"]["code"]["coding"][0]["code"]
+    assert again.entry[2].resource.subject == second["entry"][2]["resource"]["subject"]
+    assert again.entry[1].resource.valueQuantity == second["entry"][1]["resource"]["valueQuantity"]
+
+    # Parser settings are part of the key
+    message = sample_hl7_message().replace("||20231101", "||20230231")
+    conv.convert_message(message, return_dict=True)
+    strict = HL7v2ToFHIRConverter(strict_dates=True).convert_message(message, return_dict=True)
+    assert len(HL7v2ToFHIRConverter._bundle_cache) == 4
+    assert "onsetDateTime" not in strict["entry"][2]["resource"]
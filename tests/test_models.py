@@ -26,6 +26,12 @@ class TestClinicalModels:
         assert embeddings.shape[0] == 1  # Batch size 1
         assert embeddings.shape[1] > 0
 
+    def test_batch_embedding_generation(self):
+        texts = ["Patient with asthma", "Patient with hypertension and type 2 diabetes"]
+        embeddings = self.models.get_clinical_embeddings_batch(texts)
+        assert embeddings.shape[0] == len(texts)
+        assert embeddings.shape[1] > 0
+
     def test_available_models(self):
         models = self.models.list_available_models()
         assert "clinical_bert" in models
@@ -0,0 +1,30 @@
+"""Tests that importing the package stays light"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# Runs in a fresh interpreter, since other tests may already have imported torch
+LAZY_IMPORT_SCRIPT = """
+import sys
+import src
+import src.huggingface_models as hf
+
+assert "torch" not in sys.modules, "torch imported with the package"
+assert "transformers" not in sys.modules, "transformers imported with the package"
+assert "clinical_models" not in vars(hf), "clinical_models created at import"
+
+models = src.clinical_models
+assert isinstance(models, hf.ClinicalForecastingModels)
+assert vars(hf)["clinical_models"] is models
+assert src.clinical_models is models
+assert "torch" not in sys.modules, "torch imported by creating clinical_models"
+"""
+
+
+def test_import_does_not_load_ml_libraries():
+    result = subprocess.run(
+        [sys.executable, "-c", LAZY_IMPORT_SCRIPT], cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
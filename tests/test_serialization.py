@@ -0,0 +1,17 @@
+"""Tests for the shared JSON helpers"""
+import json
+from datetime import date
+
+from src.serialization import dumps, loads
+
+
+def test_dumps_json():
+    record = {"patient": {"id": "P1", "birthDate": date(1990, 1, 15)}}
+    assert json.loads(dumps(record)) == {"patient": {"id": "P1", "birthDate": "1990-01-15"}}
+    assert dumps({"a": 1}, indent=True) == json.dumps({"a": 1}, indent=2).encode()
+    assert dumps({"a": [1, 2]}) == b'{"a":[1,2]}'
+
+
+def test_loads_round_trip():
+    record = {"patient": {"id": "P1", "race": {"text": "Asian"}}}
+    assert loads(dumps(record)) == record
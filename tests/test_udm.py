@@ -2,9 +2,10 @@
 import pytest
 import sys
 import os
+import pandas as pd
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src.udm_mapper import UDMMapper
+from src.udm_mapper import UDMMapper, frame_records
 
 
 class TestUDMMapper:
@@ -30,8 +31,105 @@ class TestUDMMapper:
         assert self.mapper._map_gender_code("F") == "female"
         assert self.mapper._map_gender_code("U") == "unknown"
         assert self.mapper._map_gender_code("unknown") == "unknown"
+        assert self.mapper._map_gender_code("male") == "male"
+        assert self.mapper._map_gender_code("Female") == "female"
+        assert self.mapper._map_gender_code("o") == "other"
+        assert self.mapper._map_gender_code(None) == "unknown"
+        assert self.mapper._map_gender_code("X") == "unknown"
 
     def test_date_standardization(self):
         assert self.mapper._standardize_date("1990-01-15") == "1990-01-15"
         assert self.mapper._standardize_date("01/15/1990") == "1990-01-15"
         assert self.mapper._standardize_date("invalid") is None
+
+    def test_date_standardization_formats(self):
+        assert self.mapper._standardize_date("15/01/1990") == "1990-01-15"
+        assert self.mapper._standardize_date("19900115") == "1990-01-15"
+        assert self.mapper._standardize_date("1990-1-5") == "1990-01-05"
+        assert self.mapper._standardize_date("2020-02-30") is None
+        assert self.mapper._standardize_date("1990-W01-1") is None
+        assert self.mapper._standardize_date(19900115) is None
+
+    def test_map_ehr_batch_matches_per_record(self):
+        df = pd.DataFrame(
+            {
+                "PAT_MRN": ["A1", "A2", "A3", "A4"],
+                "BIRTH_DATE": ["1990-01-15", "01/02/1980", None, "1990-01-15"],
+                "SEX": ["M", "F", "O", None],
+                "RACE": ["White", None, "Asian", "Other"],
+                "ETHNICITY": ["Hispanic", "Not Hispanic", None, "Hispanic"],
+            }
+        )
+        # Normalize blank cells the same way map_ehr_batch does
+        expected = [self.mapper.map_ehr_to_udm(record, "epic") for record in frame_records(df)]
+        batch = self.mapper.map_ehr_batch(df, "epic")
+        assert batch == expected
+
+        # Rows with the same race/ethnicity must not share one mutable dict
+        assert batch[0]["patient"]["ethnicity"] is not batch[3]["patient"]["ethnicity"]
+        batch[0]["patient"]["ethnicity"]["text"] = "changed"
+        assert batch[3]["patient"]["ethnicity"]["text"] == "Hispanic"
+
+    def test_standardize_dates_series(self):
+        dates = pd.Series(["19900115", "15/01/1990", "invalid", None, "19900115"])
+        assert self.mapper.standardize_dates(dates).tolist() == ["1990-01-15", "1990-01-15", None, None, "1990-01-15"]
+
+    def test_standardize_dates_matches_scalar(self):
+        # Out-of-range placeholders and non-string input behave as in _standardize_date
+        values = ["9999-12-31", "1600-03-01", "0001-01-01", 19900115, "", "1990-1-5"]
+        dates = pd.Series(values, dtype=object)
+        assert self.mapper.standardize_dates(dates).tolist() == [self.mapper._standardize_date(v) for v in values]
+        assert self.mapper.standardize_dates(dates).tolist()[:4] == ["9999-12-31", "1600-03-01", "0001-01-01", None]
+
+    def test_logical_model_loaded_once(self, tmp_path, monkeypatch):
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        pd.DataFrame(
+            {"Entity": ["Patient", "Patient", "Condition"], "Attribute": ["id", "birthDate", "code"]}
+        ).to_csv(data_dir / "logical_model.csv", index=False)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(UDMMapper, "_LOGICAL_MODEL_CACHE", None)
+
+        mapper = UDMMapper()
+        assert mapper.get_entity_attributes("Patient") == ["id", "birthDate"]
+        assert mapper.get_entity_attributes("Condition") == ["code"]
+        assert mapper.get_entity_attributes("Encounter") == []
+        assert UDMMapper().logical_model is mapper.logical_model
+
+    def test_logical_model_skips_stale_parquet(self, tmp_path, monkeypatch):
+        pytest.importorskip("pyarrow")
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        pd.DataFrame({"Entity": ["Patient"], "Attribute": ["id"]}).to_parquet(data_dir / "logical_model.parquet")
+        csv_path = data_dir / "logical_model.csv"
+        pd.DataFrame({"Entity": ["Patient"], "Attribute": ["gender"]}).to_csv(csv_path, index=False)
+        monkeypatch.chdir(tmp_path)
+
+        # A CSV edited after the Parquet copy was written wins
+        parquet_mtime = os.stat(data_dir / "logical_model.parquet").st_mtime
+        os.utime(csv_path, (parquet_mtime + 10, parquet_mtime + 10))
+        monkeypatch.setattr(UDMMapper, "_LOGICAL_MODEL_CACHE", None)
+        assert UDMMapper().get_entity_attributes("Patient") == ["gender"]
+
+        # Otherwise the Parquet copy is used
+        os.utime(csv_path, (parquet_mtime - 10, parquet_mtime - 10))
+        monkeypatch.setattr(UDMMapper, "_LOGICAL_MODEL_CACHE", None)
+        assert UDMMapper().get_entity_attributes("Patient") == ["id"]
+
+    def test_missing_logical_model_cached(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(UDMMapper, "_LOGICAL_MODEL_CACHE", None)
+
+        mapper = UDMMapper()
+        assert mapper.logical_model.empty
+        assert UDMMapper().logical_model is mapper.logical_model
+
+    def test_generic_mapping_aliases(self):
+        record = {"sex": "F", "patient_id": "P2", "birthdate": "19800102", "id": "P1"}
+        result = self.mapper.map_ehr_to_udm(record, "generic")
+        assert result["patient"] == {"resourceType": "Patient", "id": "P1", "birthDate": "1980-01-02", "gender": "female"}
+
+        result = self.mapper.map_ehr_to_udm({"id": "", "patient_id": "P2", "gender": None, "sex": "M"}, "generic")
+        assert result["patient"]["id"] == "P2"
+        assert result["patient"]["gender"] == "male"
+        assert result["patient"]["birthDate"] is None
@@ -1,4 +1,6 @@
 """Unit tests for Enhanced UDM mapper"""
+import json
+
 from src.udm_mapper_enhanced import EnhancedUDMMapper
 
 
@@ -43,3 +45,91 @@ def test_udm_observation_conversion():
     assert obs.resource_type == "Observation"
     assert obs.subject.reference == "Patient/p-001"
     assert hasattr(obs, "valueQuantity") or hasattr(obs, "valueString")
+
+
+def test_generated_ids_are_unique():
+    mapper = EnhancedUDMMapper()
+    bundle = mapper.create_fhir_bundle(
+        [{"type": "observation", "code": "8480-6", "value": 120}] * 3 + [{"type": "condition", "code": "I10"}] * 2,
+        "p-001",
+    )
+
+    ids = [entry.resource.id for entry in bundle.entry]
+    assert len(set(ids)) == len(ids)
+    assert ids[0].startswith("obs-") and ids[-1].startswith("cond-")
+
+
+def test_parse_system_from_uri():
+    mapper = EnhancedUDMMapper()
+    assert mapper._parse_system_from_uri("http://snomed.info/sct") == "snomed"
+    assert mapper._parse_system_from_uri("http://hl7.org/fhir/sid/icd-10-cm") == "icd10"
+    assert mapper._parse_system_from_uri("urn:local") == "urn:local"
+
+
+def test_patient_telecom():
+    mapper = EnhancedUDMMapper()
+    patient = mapper.udm_to_fhir_patient({"patient_id": "p-002", "contact": {"email": "a@example.com"}})
+    assert patient.telecom == [{"system": "email", "value": "a@example.com"}]
+
+    # FHIR forbids empty arrays, so no telecom is emitted without contact details
+    patient = mapper.udm_to_fhir_patient({"patient_id": "p-003", "contact": {}})
+    assert getattr(patient, "telecom", None) is None
+
+
+def test_create_fhir_bundle_return_dict():
+    mapper = EnhancedUDMMapper()
+    records = [
+        {"type": "condition", "id": "c1", "code": "J45", "system": "icd10"},
+        {"type": "observation", "id": "o1", "code": "85354-9", "value": 120, "unit": "mmHg"},
+    ]
+
+    bundle = mapper.create_fhir_bundle(records, "p-001", return_dict=True)
+    condition, observation = (entry["resource"] for entry in bundle["entry"])
+    assert condition["code"]["coding"][0]["code"] == "195967001"
+    assert observation["valueQuantity"]["value"] == 120
+    assert json.loads(json.dumps(bundle)) == bundle
+
+    assert mapper.udm_to_fhir_condition(records[0], "p-001", return_dict=True) == condition
+    assert mapper.udm_to_fhir_patient({"patient_id": "p-001"}, return_dict=True)["id"] == "p-001"
+
+
+def test_create_fhir_bundle_threaded_matches_serial():
+    mapper = EnhancedUDMMapper()
+    records = [{"type": "observation", "id": f"o{i}", "code": "8480-6", "value": i} for i in range(20)]
+    records.insert(5, {"type": "medication", "id": "m1"})
+
+    serial = mapper.create_fhir_bundle(records, "p-001", return_dict=True)
+    threaded = mapper.create_fhir_bundle(records, "p-001", return_dict=True, max_workers=4)
+    assert threaded == serial
+    assert len(threaded["entry"]) == 20
+
+
+def test_mutating_returned_resource_leaves_next_result_intact():
+    mapper = EnhancedUDMMapper()
+    records = [{"type": "condition", "id": "c1", "code": "I10", "onset_date": "2020-01-01"}]
+
+    first = mapper.create_fhir_bundle(records, "p-001")
+    first.entry[0].resource.onsetDateTime = "1999-01-01"
+    first.entry[0].resource.subject["reference"] = "Patient/other"
+    first.entry[0].resource.code.text = "changed"
+    first.entry[0].resource.code.coding[0].code = "changed"
+    first.entry[0].resource.code.coding.clear()
+
+    second = mapper.create_fhir_bundle(records, "p-001")
+    assert second.entry[0].resource.onsetDateTime == "2020-01-01"
+    assert second.entry[0].resource.subject["reference"] == "Patient/p-001"
+    assert second.entry[0].resource.code.text == "Hypertension"
+    assert second.entry[0].resource.code.coding[0].code == "38341003"
+    assert mapper.udm_to_fhir_condition(records[0], "p-001").onsetDateTime == "2020-01-01"
+
+
+def test_udm_records_to_fhir_json():
+    mapper = EnhancedUDMMapper()
+    records = [
+        {"type": "condition", "id": "c1", "code": "I10"},
+        {"type": "observation", "id": "o1", "code": "8480-6", "value": 120, "unit": "mmHg"},
+    ]
+
+    payload = mapper.udm_records_to_fhir_json(records, "p-001")
+    assert isinstance(payload, bytes)
+    assert json.loads(payload) == mapper.create_fhir_bundle(records, "p-001", return_dict=True)